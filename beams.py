@@ -0,0 +1,246 @@
+import pygame
+import numpy as np
+import heapq
+
+def extend_rays(pos, end, dims):
+    # Where each ray from pos through end leaves the screen.
+    tv = end - pos
+    tx = tv[:, 0]
+    ty = tv[:, 1]
+
+    x = pos[:, 0]
+    y = pos[:, 1]
+
+    w, h = dims
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Mostly vertical rays hit the top or bottom edge...
+        r = tx / ty
+        steep_x = np.where(ty < 0, x - (r * y), x + (r * (h - y)))
+        steep_y = np.where(ty < 0, 0, h)
+
+        # ...and the others the left or right edge.
+        r = ty / tx
+        flat_x = np.where(tx < 0, 0, w)
+        flat_y = np.where(tx < 0, y - (r * x), y + (r * (w - x)))
+
+    steep = np.abs(tx) < np.abs(ty)
+
+    out = np.empty_like(pos)
+    out[:, 0] = np.where(steep, steep_x, flat_x)
+    out[:, 1] = np.where(steep, steep_y, flat_y)
+
+    return out
+
+def clip_segments(start, stop, dims):
+    # Liang-Barsky clipping of every segment against (0, 0)-dims. Returns
+    # the clipped endpoints and which segments are visible at all.
+    d = stop - start
+
+    t0 = np.zeros(len(start))
+    t1 = np.ones(len(start))
+    visible = np.all(np.isfinite(start), axis=1) & np.all(np.isfinite(stop), axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for axis in (0, 1):
+            for p, q in (
+                (-d[:, axis], start[:, axis]),
+                (d[:, axis], dims[axis] - start[:, axis]),
+            ):
+                parallel = p == 0
+                visible &= ~(parallel & (q < 0))
+
+                r = q / p
+                t0 = np.where(~parallel & (p < 0), np.maximum(t0, r), t0)
+                t1 = np.where(~parallel & (p > 0), np.minimum(t1, r), t1)
+
+    visible &= t0 <= t1
+
+    # Unclipped endpoints are passed through exactly.
+    clipped_start = np.where((t0 == 0)[:, np.newaxis], start, start + (t0[:, np.newaxis] * d))
+    clipped_stop = np.where((t1 == 1)[:, np.newaxis], stop, start + (t1[:, np.newaxis] * d))
+
+    return clipped_start, clipped_stop, visible
+
+class BeamStore(pygame.sprite.Group):
+    # Sprite group that keeps the geometry of every beam and ray in arrays,
+    # like bullet_store.BulletStore does for bullets. Rays run from pos
+    # through end to the edge of the screen; beams run from pos to end.
+    # All of them are clipped to the screen in one pass per update.
+
+    def __init__(self, dims, capacity=16):
+        pygame.sprite.Group.__init__(self)
+
+        self.dims = np.array(dims, dtype=np.float64)
+
+        self.capacity = 0
+        self.size = 0
+        self.free_slots = []
+
+        self.pos = np.zeros((0, 2), dtype=np.float64)
+        self.end = np.zeros((0, 2), dtype=np.float64)
+        self.prev_pos = np.zeros((0, 2), dtype=np.float64)
+        self.prev_end = np.zeros((0, 2), dtype=np.float64)
+        self.is_ray = np.zeros(0, dtype=bool)
+        self.width = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.slot_sprites = []
+
+        # Clipped segments as of the last update.
+        self.seg_start = np.zeros((0, 2), dtype=np.float64)
+        self.seg_stop = np.zeros((0, 2), dtype=np.float64)
+        self.visible = np.zeros(0, dtype=bool)
+
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        old = self.capacity
+
+        def extend(arr):
+            new_arr = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+            new_arr[:old] = arr[:old]
+            return new_arr
+
+        self.pos = extend(self.pos)
+        self.end = extend(self.end)
+        self.prev_pos = extend(self.prev_pos)
+        self.prev_end = extend(self.prev_end)
+        self.is_ray = extend(self.is_ray)
+        self.width = extend(self.width)
+        self.alive = extend(self.alive)
+        self.seg_start = extend(self.seg_start)
+        self.seg_stop = extend(self.seg_stop)
+        self.visible = extend(self.visible)
+        self.slot_sprites.extend([None] * (capacity - old))
+
+        for slot in range(old, capacity):
+            heapq.heappush(self.free_slots, slot)
+
+        self.capacity = capacity
+
+    def allocate(self):
+        if len(self.free_slots) == 0:
+            self.grow(self.capacity * 2)
+
+        slot = heapq.heappop(self.free_slots)
+        if slot >= self.size:
+            self.size = slot + 1
+
+        return slot
+
+    def release(self, slot):
+        self.alive[slot] = False
+        self.visible[slot] = False
+        self.slot_sprites[slot] = None
+        heapq.heappush(self.free_slots, slot)
+
+        while self.size > 0 and not self.alive[self.size - 1]:
+            self.size -= 1
+
+    def add_internal(self, sprite, layer=None):
+        pygame.sprite.Group.add_internal(self, sprite)
+
+        slot = self.allocate()
+
+        self.pos[slot] = self.prev_pos[slot] = sprite._pos
+        self.end[slot] = self.prev_end[slot] = sprite._end
+        self.is_ray[slot] = sprite.is_ray
+        self.width[slot] = sprite.width
+        self.alive[slot] = True
+        self.slot_sprites[slot] = sprite
+
+        sprite.slot = slot
+
+        self.clip_slots(np.array([slot]))
+
+    def remove_internal(self, sprite):
+        pygame.sprite.Group.remove_internal(self, sprite)
+
+        slot = sprite.slot
+        if slot is None:
+            return
+
+        sprite.slot = None
+        sprite._pos = self.pos[slot].copy()
+        sprite._end = self.end[slot].copy()
+
+        self.release(slot)
+
+    def live_slots(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    def segment_ends(self, slots, pos, end):
+        return np.where(
+            self.is_ray[slots, np.newaxis], extend_rays(pos, end, self.dims), end
+        )
+
+    def clip_slots(self, slots):
+        pos = self.pos[slots]
+        stop = self.segment_ends(slots, pos, self.end[slots])
+
+        start, stop, visible = clip_segments(pos, stop, self.dims)
+
+        self.seg_start[slots] = start
+        self.seg_stop[slots] = stop
+        self.visible[slots] = visible
+
+    def update(self, dt):
+        n = self.size
+        self.prev_pos[:n] = self.pos[:n]
+        self.prev_end[:n] = self.end[:n]
+
+        pygame.sprite.Group.update(self, dt)
+
+        # Most waves have no beams; skip the numpy overhead for them.
+        slots = self.live_slots()
+        if len(slots) > 0:
+            self.clip_slots(slots)
+
+    def draw(self, surface, alpha=1):
+        # Draws every beam between its last two ticks' geometry and returns
+        # the rects that were drawn to.
+        slots = self.live_slots()
+        if len(slots) == 0:
+            return []
+
+        pos = self.prev_pos[slots] + ((self.pos[slots] - self.prev_pos[slots]) * alpha)
+        end = self.prev_end[slots] + ((self.end[slots] - self.prev_end[slots]) * alpha)
+
+        # Lines are drawn unclipped (pygame clips them itself, with the
+        # same rasterization as before); clipping only culls the invisible.
+        stop = self.segment_ends(slots, pos, end)
+        visible = clip_segments(pos, stop, self.dims)[2]
+
+        line = pygame.draw.line
+        sprites = self.slot_sprites
+
+        return [
+            line(surface, sprites[slot].color, a, b, width)
+            for slot, a, b, width, v in zip(
+                slots.tolist(), pos.tolist(), stop.tolist(),
+                self.width[slots].tolist(), visible.tolist()
+            )
+            if v
+        ]
+
+    def distances(self, point):
+        # Distance from point to every visible segment, less half its width.
+        point = np.asarray(point, dtype=np.float64)
+        slots = np.flatnonzero(self.visible[:self.size])
+
+        a = self.seg_start[slots]
+        ab = self.seg_stop[slots] - a
+        ap = point - a
+
+        length_sq = np.sum(ab ** 2, axis=1)
+        t = np.sum(ap * ab, axis=1) / np.where(length_sq > 0, length_sq, 1)
+        t = np.clip(t, 0, 1)
+
+        closest = a + (t[:, np.newaxis] * ab)
+        dist = np.sqrt(np.sum((point - closest) ** 2, axis=1))
+
+        return slots, dist - (self.width[slots] / 2)
+
+    def query_radius(self, point, radius):
+        slots, dist = self.distances(point)
+        return slots[dist <= radius]
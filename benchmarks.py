@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+import numpy as np
+
+pygame.init()
+
+import entities
+import waves
+import game_data
+import simulation
+import headless
+
+def spawn_random_bullets(n):
+    entities.clear_bullets()
+
+    for i in range(n):
+        angle = random.uniform(0, 2 * np.pi)
+        speed = random.uniform(50, 300)
+
+        entities.ConstantPathBullet(
+            (255, 0, 0),
+            (
+                random.uniform(0, game_data.screen_dims[0]),
+                random.uniform(0, game_data.screen_dims[1])
+            ),
+            (np.cos(angle) * speed, np.sin(angle) * speed),
+            (0, 0)
+        )
+
+    # Sets images for every bullet; rects are only kept for the mask path.
+    entities.update_bullets(0)
+
+    for bullet in entities.all_bullets:
+        bullet.update_rect()
+
+def brute_force_collision():
+    # The collision check the main loop used before bullet_grid existed.
+    for bullet in pygame.sprite.spritecollide(entities.player, entities.all_bullets, False):
+        if pygame.sprite.collide_mask(entities.player, bullet) is not None:
+            return bullet
+
+    return None
+
+def grid_collision():
+    # bullet_grid as the broadphase, rebuilt for the one query, plus the
+    # narrow phase game_data selects.
+    entities.rebuild_bullet_grid()
+
+    return entities.player_hit(entities.bullet_grid.query_rect(
+        entities.player.rect, entities.bullet_extent
+    ))
+
+def game_collision():
+    # The check the game runs: one distance test over every bullet as the
+    # broadphase.
+    return entities.player_collision()
+
+def time_call(fn, repeats):
+    start = time.perf_counter()
+    for i in range(repeats):
+        fn()
+
+    return (time.perf_counter() - start) / repeats
+
+def bench_collision(args):
+    random.seed(args.seed)
+    game_data.mask_collision = args.mask
+
+    print("{:>8} {:>14} {:>14} {:>14} {:>8}".format(
+        "bullets", "brute (ms)", "grid (ms)", "game (ms)", "speedup"
+    ))
+
+    for n in args.counts:
+        spawn_random_bullets(n)
+
+        n_mismatches = 0
+        brute_total = 0
+        grid_total = 0
+        game_total = 0
+
+        for i in range(args.positions):
+            entities.player.pos = np.array((
+                random.uniform(15, game_data.screen_dims[0] - 15),
+                random.uniform(15, game_data.screen_dims[1] - 15)
+            ))
+            entities.player.update_rect()
+
+            if (brute_force_collision() is None) != (game_collision() is None):
+                n_mismatches += 1
+
+            brute_total += time_call(brute_force_collision, args.repeats)
+            grid_total += time_call(grid_collision, args.repeats)
+            game_total += time_call(game_collision, args.repeats)
+
+        brute_ms = 1000 * brute_total / args.positions
+        grid_ms = 1000 * grid_total / args.positions
+        game_ms = 1000 * game_total / args.positions
+
+        print("{:>8} {:>14.4f} {:>14.4f} {:>14.4f} {:>7.1f}x".format(
+            n, brute_ms, grid_ms, game_ms, brute_ms / game_ms
+        ))
+
+        if n_mismatches > 0:
+            # Expected in hitbox mode: the analytic shapes and the rasterized
+            # masks differ by up to a pixel at the edges.
+            print("  mask and game path disagreed at {} of {} positions".format(
+                n_mismatches, args.positions
+            ))
+
+    entities.clear_bullets()
+
+wave_phases = ['spawn', 'update', 'cull', 'collision']
+
+def bench_wave(wave_type, wave_size, duration, dt, seed):
+    # Runs one wave for a fixed simulated duration with the player parked in
+    # the middle of the screen. Collisions are tested but never kill the
+    # player, so every run covers the whole duration.
+    random.seed(seed)
+
+    game_data.key_state = headless.KeyState()
+    game_data.sim_ticks = 0
+
+    entities.clear_bullets()
+    entities.player.reset()
+    game_data.reset()
+    game_data.t = 3
+
+    timings = dict((phase, 0) for phase in wave_phases)
+    peak_bullets = 0
+    frames = 0
+
+    wave = wave_type(wave_size)
+
+    # The phases run through the same simulation functions as the game, only
+    # with this one wave instead of the wave queue and without the player
+    # being killed.
+    sim_time = 0
+    simulation.wave_clock = 0
+    while sim_time < duration:
+        game_data.sim_ticks = int(round(sim_time * 1000))
+
+        start = time.perf_counter()
+        for i in range(simulation.advance_wave_clock(dt)):
+            wave.update(simulation.wave_dt)
+        spawned = time.perf_counter()
+
+        # Player, bullets, and beams and rays.
+        simulation.update_entities(dt)
+        updated = time.perf_counter()
+
+        simulation.cull()
+        culled = time.perf_counter()
+
+        entities.player_collision()
+        collided = time.perf_counter()
+
+        timings['spawn'] += spawned - start
+        timings['update'] += updated - spawned
+        timings['cull'] += culled - updated
+        timings['collision'] += collided - culled
+
+        peak_bullets = max(peak_bullets, len(entities.all_bullets))
+        sim_time += dt
+        frames += 1
+
+    wave.end()
+    entities.clear_bullets()
+
+    result = {
+        'wave': wave_type.__name__,
+        'name': wave_type.name,
+        'wave_size': wave_size,
+        'frames': frames,
+        'spawned': wave.n_bullets_spawned,
+        'peak_bullets': peak_bullets,
+    }
+
+    for phase in wave_phases:
+        result[phase + '_ms'] = 1000 * timings[phase]
+        result[phase + '_ms_per_frame'] = 1000 * timings[phase] / frames
+
+    return result
+
+def compare_to_baseline(results, baseline, tolerance):
+    # Prints phases that got slower than tolerance times the baseline and
+    # returns how many there were.
+    baseline_results = dict(
+        ((r['wave'], r['wave_size']), r) for r in baseline['results']
+    )
+
+    n_regressions = 0
+    for r in results:
+        b = baseline_results.get((r['wave'], r['wave_size']))
+        if b is None:
+            continue
+
+        for phase in wave_phases:
+            key = phase + '_ms_per_frame'
+            if b[key] <= 0:
+                continue
+
+            ratio = r[key] / b[key]
+            if ratio > tolerance:
+                n_regressions += 1
+                print("  {} @ {}: {} {:.4f} ms/frame vs. {:.4f} baseline ({:.2f}x)".format(
+                    r['wave'], r['wave_size'], phase, r[key], b[key], ratio
+                ))
+
+    return n_regressions
+
+def bench_waves(args):
+    wave_types = waves.possible_wave_types
+    if args.waves:
+        wave_types = [w for w in wave_types if w.__name__ in args.waves]
+
+    print("{:>22} {:>6} {:>7} {:>6} {:>10} {:>10} {:>10} {:>10}".format(
+        "wave", "size", "spawned", "peak", "spawn", "update", "cull", "collision"
+    ))
+
+    results = []
+    for wave_type in wave_types:
+        for wave_size in args.sizes:
+            r = bench_wave(wave_type, wave_size, args.duration, args.dt, args.seed)
+            results.append(r)
+
+            print("{:>22} {:>6} {:>7} {:>6} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.4f}".format(
+                r['wave'], r['wave_size'], r['spawned'], r['peak_bullets'],
+                r['spawn_ms_per_frame'], r['update_ms_per_frame'],
+                r['cull_ms_per_frame'], r['collision_ms_per_frame']
+            ))
+
+    print("(ms per frame)")
+
+    output = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pygame': pygame.version.ver,
+            'duration': args.duration,
+            'dt': args.dt,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        print("Comparing against {} (tolerance {:.2f}x):".format(
+            args.baseline, args.tolerance
+        ))
+
+        n_regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if n_regressions > 0:
+            print("{} regressions.".format(n_regressions))
+            sys.exit(1)
+
+        print("No regressions.")
+
+def main():
+    parser = argparse.ArgumentParser(description="CurtainFire benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    collision = subparsers.add_parser(
+        'collision', help="player collision broadphases vs. brute force"
+    )
+    collision.add_argument(
+        '--counts', type=int, nargs='+',
+        default=[500, 1000, 2000, 5000, 10000]
+    )
+    collision.add_argument('--positions', type=int, default=20)
+    collision.add_argument('--repeats', type=int, default=10)
+    collision.add_argument('--seed', type=int, default=0)
+    collision.add_argument(
+        '--mask', action='store_true',
+        help="use mask narrow phase on the grid and game paths too"
+    )
+    collision.set_defaults(run=bench_collision)
+
+    wave_bench = subparsers.add_parser(
+        'waves', help="per-phase cost of each wave type at several wave sizes"
+    )
+    wave_bench.add_argument(
+        '--sizes', type=int, nargs='+', default=[60, 120, 240, 480, 960]
+    )
+    wave_bench.add_argument(
+        '--waves', nargs='+', help="wave class names to run (default: all)"
+    )
+    wave_bench.add_argument('--duration', type=float, default=10, help="simulated seconds")
+    wave_bench.add_argument('--dt', type=float, default=1/60)
+    wave_bench.add_argument('--seed', type=int, default=0)
+    wave_bench.add_argument('--output', help="write results as JSON")
+    wave_bench.add_argument('--baseline', help="JSON results to compare against")
+    wave_bench.add_argument(
+        '--tolerance', type=float, default=1.25,
+        help="allowed slowdown factor per phase before it counts as a regression"
+    )
+    wave_bench.set_defaults(run=bench_waves)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
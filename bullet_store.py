@@ -0,0 +1,413 @@
+import pygame
+import numpy as np
+import heapq
+from collections import defaultdict
+
+# Bullet kinds, stored per-slot so vectorized passes can branch on shape
+# without touching the sprite objects.
+KIND_TRIANGLE = 0
+KIND_ARROWHEAD = 1
+KIND_DIAMOND = 2
+KIND_RING = 3
+
+class BulletStore(pygame.sprite.Group):
+    # Sprite group that also keeps the kinematic state of every member in
+    # contiguous arrays. Each bullet owns one slot while it is in the group;
+    # freed slots are recycled lowest-first to keep the live range packed.
+
+    def __init__(self, capacity=1024, heading_steps=64):
+        pygame.sprite.Group.__init__(self)
+
+        self.heading_steps = heading_steps
+
+        self.capacity = 0
+        self.size = 0
+        self.free_slots = []
+
+        self.pos = np.zeros((0, 2), dtype=np.float64)
+        self.prev_pos = np.zeros((0, 2), dtype=np.float64)
+        self.vel = np.zeros((0, 2), dtype=np.float64)
+        self.acc = np.zeros((0, 2), dtype=np.float64)
+        self.kind = np.zeros(0, dtype=np.int8)
+        self.alive = np.zeros(0, dtype=bool)
+        self.moving = np.zeros(0, dtype=np.float64)
+        self.heading = np.zeros(0, dtype=np.int32)
+        self.slot_sprites = []
+
+        # When not None, add_internal() appends each new bullet's slot here.
+        self.spawn_log = None
+
+        # Heading bucket each sprite's image was last rotated to, or -1 to
+        # have it fetched again. Scripted bullets turn themselves in their
+        # update(), the only per-sprite call left each tick.
+        self.rotation = np.zeros(0, dtype=np.int32)
+        self.scripted = np.zeros(0, dtype=bool)
+
+        # Half the size of each bullet's current image, set by the sprite
+        # whenever its image changes; used to place images when drawing.
+        self.image_half = np.zeros((0, 2), dtype=np.int32)
+
+        # Homing bullets: index of the steering target (see
+        # entities.steering_targets) and acceleration magnitude towards it.
+        self.homing = np.zeros(0, dtype=bool)
+        self.steer_target = np.zeros(0, dtype=np.int32)
+        self.steer_acc = np.zeros(0, dtype=np.float64)
+
+        self._step = np.zeros((0, 2), dtype=np.float64)
+        self._angle = np.zeros(0, dtype=np.float64)
+        self._oob = np.zeros((0, 2), dtype=bool)
+        self._cull_mask = np.zeros(0, dtype=bool)
+        self._turned = np.zeros(0, dtype=bool)
+        self._disp = np.zeros(0, dtype=np.complex128)
+        self._dist = np.zeros(0, dtype=np.float64)
+        self._draw_pos = np.zeros((0, 2), dtype=np.float64)
+        self._draw_xy = np.zeros((0, 2), dtype=np.int32)
+
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        old = self.capacity
+
+        def extend(arr):
+            new_arr = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+            new_arr[:old] = arr[:old]
+            return new_arr
+
+        self.pos = extend(self.pos)
+        self.prev_pos = extend(self.prev_pos)
+        self.vel = extend(self.vel)
+        self.acc = extend(self.acc)
+        self.kind = extend(self.kind)
+        self.alive = extend(self.alive)
+        self.moving = extend(self.moving)
+        self.heading = extend(self.heading)
+        self.rotation = extend(self.rotation)
+        self.scripted = extend(self.scripted)
+        self.image_half = extend(self.image_half)
+        self.homing = extend(self.homing)
+        self.steer_target = extend(self.steer_target)
+        self.steer_acc = extend(self.steer_acc)
+        self._step = extend(self._step)
+        self._angle = extend(self._angle)
+        self._oob = extend(self._oob)
+        self._cull_mask = extend(self._cull_mask)
+        self._turned = extend(self._turned)
+        self._disp = extend(self._disp)
+        self._dist = extend(self._dist)
+        self._draw_pos = extend(self._draw_pos)
+        self._draw_xy = extend(self._draw_xy)
+        self.slot_sprites.extend([None] * (capacity - old))
+
+        for slot in range(old, capacity):
+            heapq.heappush(self.free_slots, slot)
+
+        self.capacity = capacity
+
+    def allocate(self):
+        if len(self.free_slots) == 0:
+            self.grow(self.capacity * 2)
+
+        slot = heapq.heappop(self.free_slots)
+        if slot >= self.size:
+            self.size = slot + 1
+
+        return slot
+
+    def release(self, slots):
+        # slots may be a single index or an index array.
+        self.alive[slots] = False
+        self.pos[slots] = 0
+        self.prev_pos[slots] = 0
+        self.vel[slots] = 0
+        self.acc[slots] = 0
+        self.moving[slots] = 0
+        self.homing[slots] = False
+
+        for slot in np.atleast_1d(slots).tolist():
+            self.slot_sprites[slot] = None
+            heapq.heappush(self.free_slots, slot)
+
+        while self.size > 0 and not self.alive[self.size - 1]:
+            self.size -= 1
+
+    def add_internal(self, sprite, layer=None):
+        pygame.sprite.Group.add_internal(self, sprite)
+
+        slot = self.allocate()
+
+        self.pos[slot] = sprite._pos
+        self.prev_pos[slot] = sprite._pos
+        self.vel[slot] = sprite._vel
+        self.acc[slot] = sprite._acc
+        self.kind[slot] = sprite.kind
+        self.alive[slot] = True
+        self.moving[slot] = 1
+        self.rotation[slot] = -1
+        self.scripted[slot] = sprite.scripted
+        self.slot_sprites[slot] = sprite
+
+        sprite.slot = slot
+
+        if self.spawn_log is not None:
+            self.spawn_log.append(slot)
+
+    def remove_internal(self, sprite):
+        pygame.sprite.Group.remove_internal(self, sprite)
+
+        slot = sprite.slot
+        if slot is None:
+            # Already detached by kill_slots().
+            return
+
+        # Hand the final state back to the sprite so code still holding a
+        # reference to a dead bullet can read its position.
+        sprite.slot = None
+        sprite._pos = self.pos[slot].copy()
+        sprite._vel = self.vel[slot].copy()
+        sprite._acc = self.acc[slot].copy()
+
+        self.release(slot)
+
+    def live_slots(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    def kill_slots(self, slots):
+        sprites = [self.slot_sprites[slot] for slot in slots.tolist()]
+
+        pos = self.pos[slots]
+        vel = self.vel[slots]
+        acc = self.acc[slots]
+
+        self.release(slots)
+
+        for sprite, p, v, a in zip(sprites, pos, vel, acc):
+            sprite.slot = None
+            sprite._pos = p
+            sprite._vel = v
+            sprite._acc = a
+            sprite.kill()
+
+        return sprites
+
+    def cull(self, dims):
+        # Kill every bullet outside the rectangle (0, 0)-dims and return how
+        # many were removed.
+        n = self.size
+        pos = self.pos[:n]
+        oob = self._oob[:n]
+        mask = self._cull_mask[:n]
+
+        np.less(pos, 0, out=oob)
+        np.logical_or(oob[:, 0], oob[:, 1], out=mask)
+
+        np.greater(pos, dims, out=oob)
+        mask |= oob[:, 0]
+        mask |= oob[:, 1]
+
+        mask &= self.alive[:n]
+
+        slots = np.flatnonzero(mask)
+        if len(slots) > 0:
+            self.kill_slots(slots)
+
+        return len(slots)
+
+    def slots_near(self, center, radius):
+        # Live slots within radius of center. Positions are viewed as
+        # complex numbers so each distance is one abs() over contiguous
+        # memory.
+        n = self.size
+        disp = self._disp[:n]
+        dist = self._dist[:n]
+        mask = self._cull_mask[:n]
+
+        np.subtract(
+            self.pos[:n].view(np.complex128)[:, 0], complex(center[0], center[1]),
+            out=disp
+        )
+        np.abs(disp, out=dist)
+        np.less_equal(dist, radius, out=mask)
+
+        mask &= self.alive[:n]
+
+        return np.flatnonzero(mask)
+
+    def integrate(self, dt):
+        n = self.size
+        step = self._step[:n]
+        moving = self.moving[:n, np.newaxis]
+
+        self.prev_pos[:n] = self.pos[:n]
+
+        np.multiply(self.acc[:n], dt, out=step)
+        step *= moving
+        self.vel[:n] += step
+
+        np.multiply(self.vel[:n], dt, out=step)
+        step *= moving
+        self.pos[:n] += step
+
+    def advance(self, slots, dt):
+        # Moves only the given slots dt further along their paths, with the
+        # same step integrate() takes.
+        moving = self.moving[slots, np.newaxis]
+
+        self.vel[slots] += self.acc[slots] * (dt * moving)
+        self.pos[slots] += self.vel[slots] * (dt * moving)
+
+    def update_headings(self):
+        # Quantize each velocity heading to one of heading_steps buckets, so
+        # sprites only re-rotate when their bucket changes.
+        n = self.size
+        angle = self._angle[:n]
+
+        np.arctan2(self.vel[:n, 1], self.vel[:n, 0], out=angle)
+        angle *= self.heading_steps / (2 * np.pi)
+        np.rint(angle, out=angle)
+        np.mod(angle, self.heading_steps, out=angle)
+
+        self.heading[:n] = angle
+
+    def rotate_sprites(self):
+        # Only sprites whose heading bucket changed need a new image.
+        n = self.size
+        turned = self._turned[:n]
+
+        np.not_equal(self.heading[:n], self.rotation[:n], out=turned)
+        turned &= self.alive[:n]
+        turned &= ~self.scripted[:n]
+
+        slots = np.flatnonzero(turned)
+        if len(slots) == 0:
+            return
+
+        headings = self.heading[slots]
+        sprites = self.slot_sprites
+
+        for slot, heading in zip(slots.tolist(), headings.tolist()):
+            sprites[slot].set_rotation_bucket(heading)
+
+        self.rotation[slots] = headings
+
+    def update(self, dt):
+        self.integrate(dt)
+        self.update_headings()
+        self.rotate_sprites()
+
+        n = self.size
+        slots = np.flatnonzero(self.scripted[:n] & self.alive[:n])
+
+        for sprite in [self.slot_sprites[slot] for slot in slots.tolist()]:
+            sprite.update(dt)
+
+    def interpolate(self, alpha):
+        # Positions blended between the last two ticks; alpha is the fraction
+        # of a tick that has elapsed since the last one.
+        n = self.size
+        out = self._draw_pos[:n]
+
+        np.subtract(self.pos[:n], self.prev_pos[:n], out=out)
+        out *= alpha
+        out += self.prev_pos[:n]
+
+        return out
+
+    def draw(self, surface, alpha=1):
+        # Returns the rects that were drawn to.
+        n = self.size
+        xy = self._draw_xy[:n]
+
+        # Same rounding as setting rect.center: half away from zero.
+        pos = self.interpolate(alpha)
+        sign = self._step[:n]
+        np.copysign(0.5, pos, out=sign)
+        pos += sign
+        np.copyto(xy, pos, casting='unsafe')
+        xy -= self.image_half[:n]
+
+        sprites = self.slot_sprites
+        xy = xy.tolist()
+
+        return surface.blits(
+            [(sprites[slot].image, xy[slot]) for slot in self.live_slots().tolist()]
+        )
+
+
+class BulletPool:
+    # Per-class free lists of killed bullets. acquire() is called from
+    # Bullet.__new__, so a recycled object gets a normal __init__ call; only
+    # classes with poolable set keep their killed instances for reuse.
+
+    def __init__(self):
+        self.free = defaultdict(list)
+
+        self.in_use = defaultdict(int)
+        self.high_water = defaultdict(int)
+        self.allocated = defaultdict(int)
+        self.reused = defaultdict(int)
+
+    def acquire(self, cls):
+        free = self.free[cls]
+
+        if len(free) > 0:
+            obj = free.pop()
+            self.reused[cls] += 1
+        else:
+            obj = object.__new__(cls)
+            self.allocated[cls] += 1
+
+        obj.pooled = False
+
+        self.in_use[cls] += 1
+        if self.in_use[cls] > self.high_water[cls]:
+            self.high_water[cls] = self.in_use[cls]
+
+        return obj
+
+    def release(self, obj):
+        if obj.pooled:
+            return
+
+        cls = type(obj)
+        obj.pooled = True
+
+        self.in_use[cls] -= 1
+        if cls.poolable:
+            self.free[cls].append(obj)
+
+    def reserve(self, cls, n):
+        # Pre-allocate free objects so the next n spawns of cls reuse them.
+        free = self.free[cls]
+
+        while len(free) < n:
+            obj = object.__new__(cls)
+            obj.pooled = True
+
+            free.append(obj)
+            self.allocated[cls] += 1
+
+    def stats(self):
+        classes = set(self.allocated.keys())
+
+        return {
+            cls.__name__: {
+                'in_use': self.in_use[cls],
+                'free': len(self.free[cls]),
+                'high_water': self.high_water[cls],
+                'allocated': self.allocated[cls],
+                'reused': self.reused[cls],
+            } for cls in classes
+        }
+
+    def report(self):
+        lines = ["Bullet pools:"]
+
+        for name, s in sorted(self.stats().items()):
+            lines.append(
+                "  {}: {} in use, {} free, high water {}, {} allocated, {} reused".format(
+                    name, s['in_use'], s['free'], s['high_water'],
+                    s['allocated'], s['reused']
+                )
+            )
+
+        return "\n".join(lines)
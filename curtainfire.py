@@ -11,6 +11,11 @@ import effects
 import waves
 import game_data
 import scores
+import simulation
+import text_cache
+import hud
+import renderer
+import frame_timing
 
 profiler = None
 
@@ -18,6 +23,23 @@ if game_data.profiler_enabled:
     import cProfile
     profiler = cProfile.Profile()
 
+def sample_label():
+    # Samples are grouped by wave; between waves, by game state.
+    wave = waves.current_wave
+    if wave is not None:
+        return wave.name
+
+    return game_data.get_game_state()
+
+sampler = None
+
+if game_data.sampling_profiler_enabled:
+    import sampling_profiler
+    sampler = sampling_profiler.SamplingProfiler(
+        game_data.sampling_interval, sample_label
+    )
+    sampler.start()
+
 actual_dims = (
     game_data.screen_dims[0] + game_data.hs_screen_width,
     game_data.screen_dims[1]
@@ -25,44 +47,78 @@ actual_dims = (
 
 screen = pygame.display.set_mode(actual_dims)
 game_data.screen = screen
+game_data.load_fonts()
 
 clk = pygame.time.Clock()
 
-pygame.time.set_timer(pygame.USEREVENT+1, 25)
+play_area = pygame.Rect((0, 0), game_data.screen_dims)
+
+frame_renderer = renderer.DirtyRectRenderer(
+    screen, game_data.dirty_rect_full_flip, game_data.dirty_rect_max_rects
+)
+
+def run_tick(dt):
+    hit_pos = simulation.tick(dt)
+
+    if hit_pos is not None:
+        effects.ExplosionEffect(hit_pos, 0, .5, 1)
+
+        if game_data.game_ending:
+            if scores.is_high_score():
+                scores.name_input_screen.reset()
+                game_data.active_subscreen = 'hs-name-input'
+            else:
+                scores.save_score()
 
 while True:
-    actual_dt = clk.tick(60) / 1000
+    actual_dt = clk.tick(game_data.frame_rate) / 1000
+    frame_timing.timer.begin_frame()
 
     dt = actual_dt * game_data.time_dilation
 
     if game_data.profiler_enabled:
         profiler.enable()
 
-    if game_data.game_running:
-        game_data.t += dt
-
-        # Decrement respawn timer if necessary:
-        if game_data.get_game_state() == 'respawn':
-            game_data.respawn_timer -= dt
-
     for event in pygame.event.get():
         if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+            # Wait for any score still being saved.
+            scores.writer.close()
+
+            if scores.writer.stats()['writes'] > 0:
+                print("Score writes: {}".format(scores.writer.stats()))
+
             if game_data.profiler_enabled:
                 profiler.create_stats()
                 profiler.dump_stats('./stats.profile')
 
+                print("Text cache: {}".format(text_cache.labels.stats()))
+                print("Renderer: {}".format(frame_renderer.stats()))
+                print(entities.bullet_pool.report())
+
+            if sampler is not None:
+                sampler.stop()
+                sampler.write_folded(game_data.sampling_output)
+
+                print("Samples per wave: {}".format(sampler.summary()))
+
+            if game_data.frame_timing_csv is not None:
+                frame_timing.timer.write_csv(game_data.frame_timing_csv)
+            if game_data.frame_timing_trace is not None:
+                frame_timing.timer.write_chrome_trace(game_data.frame_timing_trace)
+
             sys.exit()
-        elif event.type == pygame.USEREVENT+1:
-            if game_data.get_game_state() == 'gameplay' or game_data.get_game_state() == 'respawn':
-                waves.update(dt)
+        elif event.type == pygame.VIDEOEXPOSE:
+            frame_renderer.invalidate()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            # Frame timing overlay; timing starts with it if it was off.
+            game_data.frame_timing_overlay = not game_data.frame_timing_overlay
+            if game_data.frame_timing_overlay:
+                frame_timing.timer.enable()
         elif event.type == pygame.KEYDOWN:
             if game_data.get_game_state() == 'title':
                 if event.key == pygame.K_SPACE:
                     # Start a new game.
-                    entities.all_bullets.empty()
-                    entities.player.reset()
-                    waves.reset()
-                    game_data.reset()
+                    simulation.new_game()
                 elif event.key == pygame.K_LEFT:
                     game_data.difficulty = np.clip(game_data.difficulty-1, 0, 2)
                 elif event.key == pygame.K_RIGHT:
@@ -80,33 +136,42 @@ while True:
     if game_data.get_game_state() != 'hs-name-input':
         pygame.key.set_repeat()
 
-    # Clear the screen.
-    screen.fill((0, 0, 0))
+    frame_timing.timer.mark('events')
+
+    # Erase what was drawn last frame.
+    frame_renderer.begin_frame()
+    frame_timing.timer.mark('erase')
 
     if game_data.get_game_state() == 'paused':
         dt = 0
         actual_dt = 0
 
-    effects.all_effects.update(dt)
-
-    if game_data.get_game_state() == 'respawn' and entities.player.dead and game_data.respawn_timer < 3:
-        entities.player.reset()
+    effects.particles.update(dt)
+    frame_timing.timer.mark('effects')
 
-    # Normal game flow-- update bullets and check for invalid positions.
+    # Run however many fixed simulation ticks this frame's game time covers.
+    time_dilation = game_data.time_dilation
     game_data.update_time_dilation(actual_dt)
-    entities.player.update(dt)
-    entities.all_bullets.update(dt)
+    frame_timing.timer.mark('waves')
+
+    simulation.step_scheduler.advance(actual_dt, time_dilation, run_tick)
 
-    for sprite in entities.all_bullets.sprites():
-        if (
-            sprite.pos[0] < 0 or sprite.pos[0] > game_data.screen_dims[0]
-            or sprite.pos[1] < 0 or sprite.pos[1] > game_data.screen_dims[1]
-        ):
-            # Bullet went out of bounds; remove it and increment score.
-            sprite.kill()
+    # What the last tick left over: run_tick()'s response to a hit.
+    frame_timing.timer.mark('collision')
 
-            if game_data.get_game_state() == 'gameplay':
-                game_data.change_score(1)
+    # Draw bullets and the player between the last two ticks.
+    alpha = simulation.step_scheduler.alpha()
+
+    # The sidebar is part of the background; bring it up to date before
+    # anything is drawn over it.
+    sidebar_rect = hud.sidebar.draw(frame_renderer.background)
+    if sidebar_rect is not None:
+        frame_renderer.restore(sidebar_rect)
+
+    frame_timing.timer.mark('hud')
+
+    # Keep play area drawing out of the sidebar.
+    screen.set_clip(play_area)
 
     # Blit bullets and the player below everything else.
     if hasattr(entities.player, 'rect') and not entities.player.dead:
@@ -117,45 +182,48 @@ while True:
         else:
             entities.player.set_color((0, 255, 0, 255))
 
-        screen.blit(entities.player.image, entities.player.rect)
+        frame_renderer.add([entities.player.draw(screen, alpha)])
+
+    frame_renderer.add(entities.all_beams.draw(screen, alpha))
 
-    # updating beams draws them
-    entities.all_beams.update(dt)
+    frame_renderer.add(entities.all_bullets.draw(screen, alpha))
+    frame_timing.timer.mark('bullet_draw')
 
-    entities.all_bullets.draw(screen)
-    effects.all_effects.draw(screen)
+    frame_renderer.add(effects.particles.draw(screen, play_area))
+    frame_timing.timer.mark('effects')
+
+    screen.set_clip(None)
 
     if game_data.get_game_state() == 'start-countdown':
         # Countdown to game start.
-        countdown_display = game_data.prompt_font.render(
-            "{:.3f}".format(3 - game_data.t), True, (255, 0, 0)
-        )
-        w, h = countdown_display.get_size()
+        countdown_atlas = text_cache.atlas(game_data.prompt_font, (255, 0, 0))
+        countdown_text = "{:.3f}".format(3 - game_data.t)
+        w, h = countdown_atlas.size(countdown_text)
 
-        screen.blit(
-            countdown_display,
+        frame_renderer.add([countdown_atlas.draw(
+            screen, countdown_text,
             (400 - (w/2), 350 - (h/2))
-        )
+        )])
     elif game_data.get_game_state() == 'title':
         # Starting key prompt and title
-        title_display = game_data.title_font.render(
-            "CurtainFire", True, (0, 255, 0)
+        title_display = text_cache.labels.render(
+            game_data.title_font, "CurtainFire", True, (0, 255, 0)
         )
 
         w, h = title_display.get_size()
 
-        screen.blit(
+        frame_renderer.blit(
             title_display,
             (400 - (w/2), 200 - (h/2))
         )
 
         # Difficulty selector:
-        t = game_data.display_font.render(
-            "Difficulty:", True, (255, 255, 255)
+        t = text_cache.labels.render(
+            game_data.display_font, "Difficulty:", True, (255, 255, 255)
         )
         w, h = t.get_size()
 
-        screen.blit(t, (220, 500))
+        frame_renderer.blit(t, (220, 500))
 
         w1 = w
         c = (255, 255, 255)
@@ -167,86 +235,90 @@ while True:
             c = (255, 0, 0) # red
             d_name = "Hard"
 
-        d = game_data.display_font.render(d_name, True, c)
-        screen.blit(d, (220 + w1 + 30, 500))
+        d = text_cache.labels.render(game_data.display_font, d_name, True, c)
+        frame_renderer.blit(d, (220 + w1 + 30, 500))
 
         if pygame.time.get_ticks() % 1000 > 500:
-            prompt_display = game_data.prompt_font.render(
-                "Press SPACE", True, (255, 255, 255)
+            prompt_display = text_cache.labels.render(
+                game_data.prompt_font, "Press SPACE", True, (255, 255, 255)
             )
 
             w, h = prompt_display.get_size()
 
-            screen.blit(
+            frame_renderer.blit(
                 prompt_display,
                 (400 - (w/2), 400 - (h/2))
             )
     elif game_data.get_game_state() == 'hs-name-input':
         scores.name_input_screen.update(dt)
-        screen.blit(scores.name_input_screen.screen, (0, 0))
+
+        # One blit of everything it drew; its rects overlap.
+        drawn = scores.name_input_screen.drawn_rects
+        rect = drawn[0].unionall(drawn[1:])
+        frame_renderer.blit(scores.name_input_screen.screen, rect, rect)
+
+    # Numbers that change every frame are drawn from glyph atlases.
+    display_atlas = text_cache.atlas(game_data.display_font, (255, 255, 255))
+    fps_atlas = text_cache.atlas(game_data.fps_font, (255, 255, 255))
 
     # Display interesting info at the bottom of the screen.
-    score_display = game_data.display_font.render(
-        "Wave: {:02n} Score: {:05n} Wave Size: {:04n}".format(
-            game_data.current_wave_number, game_data.score, game_data.current_wave_size+1
-        ), True, (255, 255, 255)
+    score_text = "Wave: {:02n} Score: {:05n} Wave Size: {:04n}".format(
+        game_data.current_wave_number, game_data.score, game_data.current_wave_size+1
     )
 
-    sw, sh = score_display.get_size()
-    screen.blit(score_display, (400 - (sw/2), 800-sh))
+    sw, sh = display_atlas.size(score_text)
+    frame_renderer.add([
+        display_atlas.draw(screen, score_text, (400 - (sw/2), 800-sh))
+    ])
 
     if waves.current_wave is not None:
         pattern_display = None
 
         if len(waves.wave_queue) >= 1:
-            pattern_display = game_data.fps_font.render(
+            pattern_display = text_cache.labels.render(
+                game_data.fps_font,
                 "Pattern: {}    Next Pattern: {}".format(
                     waves.current_wave.name,
                     waves.wave_queue[-1].name
                 ), True, (255, 255, 255)
             )
         else:
-            pattern_display = game_data.fps_font.render(
+            pattern_display = text_cache.labels.render(
+                game_data.fps_font,
                 "Pattern: {}".format(
                     waves.current_wave.name
                 ), True, (255, 255, 255)
             )
 
         pw, ph = pattern_display.get_size()
-        screen.blit(pattern_display, (400 - (pw/2), 800-sh-ph))
-
-    fps_display = game_data.fps_font.render(
-        "{:02n}".format(clk.get_fps()), True, (255, 255, 255)
-    )
+        frame_renderer.blit(pattern_display, (400 - (pw/2), 800-sh-ph))
 
-    screen.blit(fps_display, (0, 0))
+    frame_renderer.add([
+        fps_atlas.draw(screen, "{:02n}".format(clk.get_fps()), (0, 0))
+    ])
 
     if game_data.get_game_state() == 'gameplay' or game_data.get_game_state() == 'respawn':
-        main_time_display = game_data.display_font.render(
-            "Time: {:.3f}".format(game_data.t - 3), True, (255, 255, 255)
-        )
+        main_time_text = "{:.3f}".format(game_data.t - 3)
 
-        tw, th = main_time_display.get_size()
-        screen.blit(main_time_display, (175-(tw/2), 0))
+        tw, th = display_atlas.size(main_time_text, "Time: ")
+        frame_renderer.add([
+            display_atlas.draw(screen, main_time_text, (175-(tw/2), 0), "Time: ")
+        ])
 
 
-        wave_time_display = game_data.display_font.render(
-            "Wave Time: {:.3f}".format(waves.current_wave.wave_timer),
-            True, (255, 255, 255)
-        )
+        wave_time_text = "{:.3f}".format(waves.current_wave.wave_timer)
 
-        tw, th = wave_time_display.get_size()
-        screen.blit(wave_time_display, (550-(tw/2), 0))
+        tw, th = display_atlas.size(wave_time_text, "Wave Time: ")
+        frame_renderer.add([
+            display_atlas.draw(screen, wave_time_text, (550-(tw/2), 0), "Wave Time: ")
+        ])
     elif game_data.get_game_state() == 'paused' and (pygame.time.get_ticks() % 1000) > 500:
-        pause_display = game_data.display_font.render(
-            "Game Paused", True, (255, 255, 255)
+        pause_display = text_cache.labels.render(
+            game_data.display_font, "Game Paused", True, (255, 255, 255)
         )
 
         w, h = pause_display.get_size()
-        screen.blit(pause_display, (400 - (w/2), 0))
-
-    hs_display = scores.render_high_scores()
-    screen.blit(hs_display, (800, 0))
+        frame_renderer.blit(pause_display, (400 - (w/2), 0))
 
     if (
         scores.is_high_score()
@@ -259,87 +331,27 @@ while True:
         )
 
         w, h = hs_display.get_size()
-        screen.blit(
+        frame_renderer.blit(
             hs_display, (800 + (game_data.hs_screen_width / 2) - (w / 2), 790 - h)
         )
 
-    if game_data.game_running:
-        # Render display segment title
-        t = game_data.display_font.render(
-            "Lives: ", True, (255, 255, 255)
+    if game_data.frame_timing_overlay:
+        overlay_rect = frame_timing.timer.draw_overlay(
+            screen, (0, 25), game_data.fps_font,
+            game_data.frame_timing_window, game_data.frame_timing_refresh
         )
 
-        w, h = t.get_size()
-        screen.blit(t, (815, 740-h))
-
-        # Render lives count in white normally, use red if last lift
-        color = (255, 255, 255, 255)
-        if game_data.lives == 0:
-            color = (255, 0, 0, 255)
-
-        # Blit lives count to screen.
-        c = game_data.display_font.render(
-            "{:01n}".format(game_data.lives), True, color
-        )
-        screen.blit(c, (815+h+65, 740-h))
+        if overlay_rect is not None:
+            frame_renderer.add([overlay_rect])
 
-        # Render time dilation constant
-        td = game_data.fps_font.render(
-            "Time Dilation: {:.2f}".format(game_data.time_dilation), True,
-            (255, 255, 255, 255)
-        )
-
-        w, h = td.get_size()
-        screen.blit(td, (
-            800 + (game_data.hs_screen_width / 2) - (w / 2), 640 - h
-        ))
-
-        # Render time dilation usage bar
-        max_td_bar_size = game_data.hs_screen_width - 40
-        cur_td_bar_size = (
-            max_td_bar_size
-            * game_data.time_dilation_usage
-            / game_data.time_dilation_max
-        )
-
-        bar_bg = pygame.Rect((820, 650), (max_td_bar_size, 20))
-        bar_fg = pygame.Rect((820, 650), (cur_td_bar_size, 20))
-
-        pygame.draw.rect(screen, (192, 192, 192), bar_bg)
-
-        if game_data.time_dilation_must_recharge:
-            pygame.draw.rect(screen, (255, 0, 0), bar_fg)
-        else:
-            pygame.draw.rect(screen, (0, 0, 255), bar_fg)
-
-    if game_data.get_game_state() == 'gameplay':
-        collision_check_list = pygame.sprite.spritecollide(entities.player, entities.all_bullets, False)
-        bullet_collided = False
-
-        for bullet in collision_check_list:
-            if pygame.sprite.collide_mask(entities.player, bullet) is not None:
-                bullet_collided = True
-                break
-
-        if bullet_collided:
-            print("Time: {:.3f}\nScore: {}".format(game_data.t - 3, game_data.score))
-
-            effects.ExplosionEffect(entities.player.pos, 0, .5, 1)
-            entities.player.kill()
-
-            game_data.lives -= 1
-            game_data.respawn_timer = game_data.respawn_length
-
-            if game_data.lives < 0:
-                game_data.game_over()
-
-                if scores.is_high_score():
-                    scores.name_input_screen.reset()
-                    game_data.active_subscreen = 'hs-name-input'
-                else:
-                    scores.save_score()
+    frame_timing.timer.mark('hud')
 
     if game_data.profiler_enabled:
         profiler.disable()
 
-    pygame.display.flip()
+    frame_renderer.present()
+    frame_timing.timer.mark('flip')
+
+    frame_timing.timer.end_frame(
+        waves.current_wave.name if waves.current_wave is not None else None
+    )
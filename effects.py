@@ -2,25 +2,34 @@ import pygame
 import numpy as np
 import math
 import random
-import entities
-import game_data
 
-all_effects = pygame.sprite.Group()
+# Striped text is cached per phase, and the per-character glyphs it is
+# built from are shared between phases.
+# (font, char, color) -> surface
+striped_glyphs = {}
+# (text, font, col_main, col_high, spacing, phase) -> surface
+striped_text = {}
 
-def render_striped_text(text, font, col_main, col_high, spacing, period):
-    t = pygame.time.get_ticks()
-    overall_period = (spacing + 1) * period
-    phase = int((t % overall_period) / period)
+def striped_glyph(font, c, color):
+    key = (font, c, tuple(color))
+
+    s = striped_glyphs.get(key)
+    if s is None:
+        s = font.render(c, False, color)
+        striped_glyphs[key] = s
+
+    return s
 
+def compose_striped_text(text, font, col_main, col_high, spacing, phase):
     surfaces = []
     i = 0
     for c in text:
         char_phase = i % (spacing+1)
         s2 = None
         if char_phase == phase:
-            s2 = font.render(c, False, col_high)
+            s2 = striped_glyph(font, c, col_high)
         else:
-            s2 = font.render(c, False, col_main)
+            s2 = striped_glyph(font, c, col_main)
 
         if c != ' ':
             i += 1
@@ -37,44 +46,179 @@ def render_striped_text(text, font, col_main, col_high, spacing, period):
         dest.blit(s, (current_w, 0))
         current_w += s.get_width()
 
+    if pygame.display.get_surface() is not None:
+        dest = dest.convert_alpha()
+
     return dest
 
+def render_striped_text(text, font, col_main, col_high, spacing, period):
+    t = pygame.time.get_ticks()
+    overall_period = (spacing + 1) * period
+    phase = int((t % overall_period) / period)
+
+    key = (text, font, tuple(col_main), tuple(col_high), spacing, phase)
+
+    dest = striped_text.get(key)
+    if dest is None:
+        dest = compose_striped_text(text, font, col_main, col_high, spacing, phase)
+        striped_text[key] = dest
+
+    return dest
+
+
+class ParticleSystem:
+    # Boxes that grow and shrink back over their lifetime, for every live
+    # explosion at once. State lives in fixed-capacity arrays that double
+    # when full; dead slots are reused by later emitters.
+
+    def __init__(self, capacity=256):
+        self.capacity = 0
+        self.size = 0
+
+        self.center = np.zeros((0, 2), dtype=np.float64)
+        self.box_size = np.zeros((0, 2), dtype=np.float64)
+        self.color = np.zeros((0, 4), dtype=np.uint8)
+        self.age = np.zeros(0, dtype=np.float64)
+        self.lifetime = np.zeros(0, dtype=np.float64)
+        self.scale = np.zeros(0, dtype=np.float64)
+        self.alive = np.zeros(0, dtype=bool)
+
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        old = self.capacity
 
-class Effect(entities.Entity):
-    def __init__(self, pos, rot, tm, scale):
-        entities.Entity.__init__(self, pos, rot)
-        all_effects.add(self)
+        def extend(arr):
+            new_arr = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+            new_arr[:old] = arr[:old]
+            return new_arr
 
-        self.t = 0
-        self.len = tm
-        self.scale = scale
+        self.center = extend(self.center)
+        self.box_size = extend(self.box_size)
+        self.color = extend(self.color)
+        self.age = extend(self.age)
+        self.lifetime = extend(self.lifetime)
+        self.scale = extend(self.scale)
+        self.alive = extend(self.alive)
+
+        self.capacity = capacity
+
+    def allocate(self, n):
+        free = np.flatnonzero(~self.alive)
+        while len(free) < n:
+            self.grow(self.capacity * 2)
+            free = np.flatnonzero(~self.alive)
+
+        slots = free[:n]
+        self.size = max(self.size, slots[-1] + 1)
+
+        return slots
+
+    def emit(self, centers, sizes, colors, lifetime, scale):
+        if len(centers) == 0:
+            return np.zeros(0, dtype=np.intp)
+
+        slots = self.allocate(len(centers))
+
+        self.center[slots] = centers
+        self.box_size[slots] = sizes
+        self.color[slots] = colors
+        self.age[slots] = 0
+        self.lifetime[slots] = lifetime
+        self.scale[slots] = scale
+        self.alive[slots] = True
+
+        return slots
 
     def update(self, dt):
-        self.t += dt
+        n = self.size
+
+        self.age[:n] += dt
+        self.alive[:n] &= self.age[:n] < self.lifetime[:n]
+
+        while self.size > 0 and not self.alive[self.size - 1]:
+            self.size -= 1
+
+    def rects(self):
+        # (slots, x, y, w, h) of every live box this frame. Boxes grow to
+        # full size at half their lifetime, then shrink back.
+        n = self.size
+        slots = np.flatnonzero(self.alive[:n])
+
+        half = self.lifetime[slots] / 2
+        t_factor = self.age[slots] / half
+        t_factor = np.where(self.age[slots] > half, 2 - t_factor, t_factor)
+
+        wh = (
+            (self.scale[slots] * t_factor)[:, np.newaxis]
+            * self.box_size[slots]
+        ).astype(int)
+
+        # Same placement as setting rect.center on a box of size wh.
+        center = self.center[slots]
+        xy = np.trunc(center + np.copysign(0.5, center)).astype(int) - (wh // 2)
+
+        return slots, xy[:, 0], xy[:, 1], wh[:, 0], wh[:, 1]
+
+    def draw(self, surface, clip=None):
+        # Returns the rects that were drawn to.
+        slots, x, y, w, h = self.rects()
+
+        # Clip here rather than in fill(), which mishandles rects that
+        # start at negative coordinates.
+        if clip is None:
+            clip = surface.get_clip()
+
+        x1 = np.minimum(x + w, clip.right)
+        y1 = np.minimum(y + h, clip.bottom)
+        x = np.maximum(x, clip.left)
+        y = np.maximum(y, clip.top)
+        w = x1 - x
+        h = y1 - y
+
+        visible = (w > 0) & (h > 0)
+        slots = slots[visible]
+        if len(slots) == 0:
+            return []
+
+        fill = surface.fill
+        return [
+            fill(color, (rx, ry, rw, rh))
+            for color, rx, ry, rw, rh in zip(
+                map(tuple, self.color[slots].tolist()),
+                x[visible].tolist(), y[visible].tolist(),
+                w[visible].tolist(), h[visible].tolist()
+            )
+        ]
+
 
+particles = ParticleSystem()
+
+
+class ExplosionEffect:
+    # Emits one explosion's boxes into particles. Random values are drawn in
+    # the same order as before, so explosions leave the random module (which
+    # wave generation also uses) in the same state.
 
-class ExplosionEffect(Effect):
     def __init__(self, pos, rot, length, scale):
-        Effect.__init__(self, pos, rot, length, scale)
+        self.pos = np.array(pos, dtype=np.float64)
 
-        self.image = pygame.Surface(game_data.screen_dims, flags=pygame.SRCALPHA)
-        self.image.fill((0, 0, 0, 0))
+        n_boxes = int(random.uniform(20, 35))
 
-        self.rect = self.image.get_rect()
-        self.rect.x = 0
-        self.rect.y = 0
+        centers = np.zeros((n_boxes, 2), dtype=np.float64)
+        sizes = np.zeros((n_boxes, 2), dtype=np.float64)
+        colors = np.zeros((n_boxes, 4), dtype=np.uint8)
 
-        self.boxes = []
-        for i in range(int(random.uniform(20, 35))):
-            cen = np.array((
+        for i in range(n_boxes):
+            centers[i] = np.array((
                 random.uniform(-15, 15),
                 random.uniform(-15, 15)
-            ), dtype=np.int)
+            ), dtype=int)
 
-            sz = np.array((
+            sizes[i] = (
                 random.uniform(5, 15) * random.choice((-1, 1)),
                 random.uniform(5, 15) * random.choice((-1, 1))
-            ), dtype=np.float)
+            )
 
             col = pygame.color.Color(0, 0, 0, 0)
             col.hsva = (
@@ -84,28 +228,15 @@ class ExplosionEffect(Effect):
                 100
             )
 
-            self.boxes.append((cen, sz, col))
-
-    def draw_box(self, box):
-        t_factor = self.t / (self.len / 2)
-
-        if self.t > self.len / 2:
-            t_factor = 2 - t_factor
+            colors[i] = tuple(col)
 
-        scaled_sz = (self.scale * t_factor * box[1]).astype(np.int)
+        centers += self.pos
 
-        r = pygame.rect.Rect((0, 0), scaled_sz)
-        r.center = box[0] + self.pos
+        # pygame.draw.rect never drew the boxes that were flipped to a
+        # negative width or height, so only the others are emitted.
+        visible = (sizes > 0).all(axis=1)
+        centers = centers[visible]
+        sizes = sizes[visible]
+        colors = colors[visible]
 
-        pygame.draw.rect(self.image, box[2], r)
-
-    def update(self, dt):
-        Effect.update(self, dt)
-
-        self.image.fill((0, 0, 0, 0))
-
-        if self.t < self.len:
-            for box in self.boxes:
-                self.draw_box(box)
-        else:
-            self.kill()
+        self.slots = particles.emit(centers, sizes, colors, length, scale)
@@ -3,10 +3,27 @@ import numpy as np
 import math
 import random
 import game_data
-
-all_bullets = pygame.sprite.Group()
-all_beams = pygame.sprite.Group()
-homing_bullets = pygame.sprite.Group()
+import bullet_store
+import sprite_cache
+import spatial_hash
+import hitboxes
+import beams
+
+all_bullets = bullet_store.BulletStore(
+    heading_steps=sprite_cache.rotation_cache.steps
+)
+bullet_grid = spatial_hash.SpatialHash(32)
+bullet_grid_stale = True
+bullet_pool = bullet_store.BulletPool()
+
+# Entities that homing bullets steer towards; all_bullets.steer_target
+# indexes into this list. Targets no homing bullet uses any more are
+# dropped by prune_steering_targets().
+steering_targets = []
+
+# Largest distance from a bullet's center to the edge of its rotated rect.
+bullet_extent = 12
+all_beams = beams.BeamStore(game_data.screen_dims)
 
 class Entity(pygame.sprite.Sprite):
     def __init__(self, pos, rot):
@@ -23,6 +40,9 @@ class Entity(pygame.sprite.Sprite):
 
         self.dead = False
 
+        self.rotation_bucket = None
+        self.rotated_base = None
+
     def kill(self):
         self.dead = True
         pygame.sprite.Sprite.kill(self)
@@ -47,16 +67,32 @@ class Entity(pygame.sprite.Sprite):
         if x_only:
             self.acc[1] = 0
 
+    def set_rotation_bucket(self, bucket):
+        # Only fetch a new image when the heading bucket or base image
+        # actually changed; rotations are shared through the rotation cache.
+        if bucket != self.rotation_bucket or self.base_image is not self.rotated_base:
+            self.image, self.mask = sprite_cache.rotation_cache.get(
+                self.base_image, bucket
+            )
+
+            self.rotation_bucket = bucket
+            self.rotated_base = self.base_image
+
+            self.image_changed()
+
+    def image_changed(self):
+        pass
+
     def rotate_to_velocity(self):
-        rot = np.arctan2(self.vel[1], self.vel[0])
+        rot = math.atan2(self.vel[1], self.vel[0])
 
-        self.image = pygame.transform.rotate(self.base_image, -np.degrees(rot))
+        self.set_rotation_bucket(sprite_cache.rotation_cache.bucket(rot))
 
     def rotate_towards_point(self, target):
         disp = self.pos - target
-        rot = np.arctan2(disp[1], disp[0])
+        rot = math.atan2(disp[1], disp[0])
 
-        self.image = pygame.transform.rotate(self.base_image, -np.degrees(rot))
+        self.set_rotation_bucket(sprite_cache.rotation_cache.bucket(rot))
 
     def update_rect(self):
         self.rect = self.image.get_rect()
@@ -79,11 +115,15 @@ class Player(Entity):
         self.image = pygame.Surface([5, 5], flags=pygame.SRCALPHA)
         self.image.fill((0, 255, 0, 255))
 
+        # Position as of the previous tick, for render interpolation.
+        self.prev_pos = np.array(self.pos)
+        self._draw_pos = np.zeros(2, dtype=np.float64)
+
     def set_color(self, color):
         self.image.fill(color)
 
     def update_movement(self):
-        pressed = pygame.key.get_pressed()
+        pressed = game_data.get_pressed()
 
         left = pressed[pygame.K_LEFT] or pressed[pygame.K_a]
         right = pressed[pygame.K_RIGHT] or pressed[pygame.K_d]
@@ -117,6 +157,8 @@ class Player(Entity):
         self.rot = self.start_rot
         self.rvel = self.racc = 0
 
+        self.prev_pos[:] = self.pos
+
         self.dead = False
 
     def kill(self):
@@ -127,6 +169,8 @@ class Player(Entity):
         ))
 
     def update(self, dt):
+        self.prev_pos[:] = self.pos
+
         if game_data.get_game_state() != 'title':
             self.update_movement()
             self.update_pos(dt)
@@ -143,59 +187,62 @@ class Player(Entity):
 
         self.update_rect()
 
+    def draw(self, surface, alpha=1):
+        pos = self._draw_pos
+        np.subtract(self.pos, self.prev_pos, out=pos)
+        pos *= alpha
+        pos += self.prev_pos
 
-class Beam(Entity):
-    def __init__(self, start, end, width, color):
-        Entity.__init__(self, start, 0)
-        self.color = color
-        self.end = end
-        self.width = width
+        w, h = self.image.get_size()
+        # Rounded like rect.center; the player is always at positive coordinates.
+        return surface.blit(self.image, (int(pos[0] + 0.5) - (w // 2), int(pos[1] + 0.5) - (h // 2)))
 
-        all_beams.add(self)
 
-    def update(self, dt):
-        self.update_pos(dt)
+def _store_field(store, name):
+    # Bullet kinematics and beam geometry live in their store while the
+    # sprite has a slot, and in a private copy on the sprite before it is
+    # added / after it is killed.
+    private = '_' + name
 
-        pygame.draw.line(
-            game_data.screen, self.color, self.pos, self.end, self.width
-        )
+    def get_field(self):
+        if self.slot is None:
+            return getattr(self, private)
+        return getattr(store, name)[self.slot]
 
-        self.rect = pygame.Rect((0, 0), game_data.screen_dims)
+    def set_field(self, value):
+        if self.slot is None:
+            setattr(self, private, np.array(value, dtype=np.float64))
+        else:
+            getattr(store, name)[self.slot] = value
 
+    return property(get_field, set_field)
+
+
+class Beam(Entity):
+    # Geometry is clipped and drawn for every beam at once by all_beams.
+    is_ray = False
+
+    pos = _store_field(all_beams, 'pos')
+    end = _store_field(all_beams, 'end')
 
-class Ray(Beam):
     def __init__(self, start, end, width, color):
-        global last_ray_update_status
-        Beam.__init__(self, start, end, width, color)
+        self.slot = None
+        Entity.__init__(self, start, 0)
+        self.color = color
+        self.end = end
+        self.width = width
 
         self.rect = pygame.Rect((0, 0), game_data.screen_dims)
 
+        all_beams.add(self)
+
     def update(self, dt):
         self.update_pos(dt)
 
-        target_vector = self.end - self.pos
-
-        endpt = [0, 0]
-        if abs(target_vector[0]) < abs(target_vector[1]):
-            r = target_vector[0] / target_vector[1]
-            if target_vector[1] < 0:
-                endpt[1] = 0
-                endpt[0] = self.pos[0] + (-r * self.pos[1])
-            else:
-                endpt[1] = game_data.screen_dims[1]
-                endpt[0] = self.pos[0] + (r * (game_data.screen_dims[1] - self.pos[1]))
-        else:
-            r = target_vector[1] / target_vector[0]
-            if target_vector[0] < 0:
-                endpt[0] = 0
-                endpt[1] = self.pos[1] + (-r * self.pos[0])
-            else:
-                endpt[0] = game_data.screen_dims[0]
-                endpt[1] = self.pos[1] + (r * (game_data.screen_dims[0] - self.pos[0]))
 
-        pygame.draw.line(
-            game_data.screen, self.color, self.pos, endpt, self.width
-        )
+class Ray(Beam):
+    # Extends from pos through end to the edge of the screen.
+    is_ray = True
 
 
 class TrackingRay(Ray):
@@ -232,12 +279,55 @@ class TrackingBeam(Beam):
 
 
 class Bullet(Entity):
+    kind = bullet_store.KIND_TRIANGLE
+
+    # Killed bullets go back to bullet_pool for reuse. Classes that waves
+    # keep references to after they die must not be pooled.
+    poolable = True
+
+    # all_bullets moves and turns every bullet; only scripted ones get an
+    # update() call each tick, for logic of their own. rect is not kept up
+    # to date, since only mask_collision() reads it.
+    scripted = False
+
+    pos = _store_field(all_bullets, 'pos')
+    vel = _store_field(all_bullets, 'vel')
+    acc = _store_field(all_bullets, 'acc')
+
+    def __new__(cls, *args, **kwargs):
+        return bullet_pool.acquire(cls)
+
     def __init__(self, color, pos, rot):
+        self.slot = None
         Entity.__init__(self, pos, rot)
         self.color = color
 
         all_bullets.add(self)
 
+    def kill(self):
+        Entity.kill(self)
+        bullet_pool.release(self)
+
+    def set_moving(self, moving):
+        if self.slot is not None:
+            all_bullets.moving[self.slot] = 1 if moving else 0
+
+    def image_changed(self):
+        w, h = self.image.get_size()
+        all_bullets.image_half[self.slot] = (w // 2, h // 2)
+
+    def base_image_changed(self):
+        # all_bullets only turns sprites when their heading changes.
+        if self.slot is not None:
+            all_bullets.rotation[self.slot] = -1
+
+    def rotate_to_velocity(self):
+        # Headings are bucketed for every bullet at once by all_bullets.
+        self.set_rotation_bucket(int(all_bullets.heading[self.slot]))
+
+    def update(self, dt):
+        pass
+
 
 class ConstantPathBullet(Bullet):
     def __init__(self, color, pos, vel, acc):
@@ -246,23 +336,16 @@ class ConstantPathBullet(Bullet):
         self.vel = np.array(vel)
         self.acc = np.array(acc)
 
-        self.base_image = pygame.Surface((20, 10), flags=pygame.SRCALPHA)
-        self.base_image.fill((0, 0, 0, 0))
-        pygame.draw.polygon(
-            self.base_image, self.color,
-            [(0, 0), (0, 10), (20, 5)]
-        )
+        self.base_image = sprite_cache.base_images.get('triangle', self.color)
 
         self.image = self.base_image
         self.rect = self.image.get_rect()
 
-    def update(self, dt):
-        self.update_pos(dt)
-        self.rotate_to_velocity()
-        self.update_rect()
-
 
 class MarkerBullet(ConstantPathBullet):
+    kind = bullet_store.KIND_RING
+    poolable = False
+
     def __init__(self, color, pos):
         ConstantPathBullet.__init__(self, color, pos, np.zeros(2), np.zeros(2))
         self.set_color(color)
@@ -272,20 +355,16 @@ class MarkerBullet(ConstantPathBullet):
 
     def set_color(self, color):
         self.color = color
-        self.base_image = pygame.Surface((20, 20), flags=pygame.SRCALPHA)
-        self.base_image.fill((0, 0, 0, 0))
-        pygame.draw.circle(
-            self.base_image, color,
-            (10, 10), 10, 3
-        )
 
-        pygame.draw.circle(
-            self.base_image, color,
-            (10, 10), 3
-        )
+        self.base_image = sprite_cache.base_images.get('ring', color)
+        self.base_image_changed()
 
 
 class TracerBullet(Bullet):
+    # Used as wave leaders, which waves check for .dead after they are killed.
+    poolable = False
+    scripted = True
+
     def __init__(self, c1, c2, pos, vel, acc):
         Bullet.__init__(self, c1, pos, 0)
 
@@ -293,75 +372,49 @@ class TracerBullet(Bullet):
         self.vel = np.array(vel)
         self.acc = np.array(acc)
 
-        self.base1 = pygame.Surface((20, 10), flags=pygame.SRCALPHA)
-        self.base1.fill((0, 0, 0, 0))
-        pygame.draw.polygon(
-            self.base1, self.color,
-            [(0, 0), (0, 10), (20, 5)]
-        )
-
-        self.base2 = pygame.Surface((20, 10), flags=pygame.SRCALPHA)
-        self.base2.fill((0, 0, 0, 0))
-        pygame.draw.polygon(
-            self.base2, self.color_2,
-            [(0, 0), (0, 10), (20, 5)]
-        )
+        self.base1 = sprite_cache.base_images.get('triangle', self.color)
+        self.base2 = sprite_cache.base_images.get('triangle', self.color_2)
 
         self.image = self.base_image = self.base1
         self.rect = self.image.get_rect()
 
     def update(self, dt):
-        self.update_pos(dt)
-
-        if pygame.time.get_ticks() % 200 > 100:
+        if game_data.get_ticks() % 200 > 100:
             self.base_image = self.base1
         else:
             self.base_image = self.base2
 
         self.rotate_to_velocity()
-        self.update_rect()
 
 
 class HomingBullet(Bullet):
+    kind = bullet_store.KIND_ARROWHEAD
+
     def __init__(self, color, pos, target, target_acc):
         Bullet.__init__(self, color, pos, 0)
 
         self.target = target
         self.target_acc = target_acc
 
-        self.base_image = pygame.Surface((20, 10), flags=pygame.SRCALPHA)
-        self.base_image.fill((0, 0, 0, 0))
-        pygame.draw.polygon(
-            self.base_image, self.color,
-            [(0, 0), (5, 5), (0, 10), (20, 5)]
-        )
+        self.base_image = sprite_cache.base_images.get('arrowhead', self.color)
 
         self.image = self.base_image
         self.rect = self.image.get_rect()
 
-        homing_bullets.add(self)
-
-    def update(self, dt):
-        if not self.target.dead and not (self.target == player and game_data.get_game_state() == 'respawn'):
-            self.accelerate_to(self.target.pos, self.target_acc)
-        else:
-            self.acc = self.vel * 0.1
-
-        self.update_pos(dt)
-        self.rotate_to_velocity()
-        self.update_rect()
+        # Steering for all homing bullets is done by steer_homing_bullets().
+        all_bullets.homing[self.slot] = True
+        all_bullets.steer_target[self.slot] = steering_target_index(target)
+        all_bullets.steer_acc[self.slot] = target_acc
 
 
 class SegmentedPathBullet(Bullet):
+    kind = bullet_store.KIND_DIAMOND
+    scripted = True
+
     def __init__(self, color, pos, segment_len, pause_time, update_trajectory_fn=None):
         Bullet.__init__(self, color, pos, 0)
 
-        self.base_image = pygame.Surface((20, 10), flags=pygame.SRCALPHA)
-        self.base_image.fill((0, 0, 0, 0))
-        pygame.draw.polygon(
-            self.base_image, self.color,
-            [(0, 5), (10, 0), (20, 5), (10, 10)]
-        )
+        self.base_image = sprite_cache.base_images.get('diamond', self.color)
 
         self.image = self.base_image
         self.rect = self.image.get_rect()
@@ -375,14 +428,14 @@ class SegmentedPathBullet(Bullet):
         self.update_trajectory = update_trajectory_fn
 
     def update(self, dt):
+        # all_bullets only integrates this bullet while it has segment length
+        # left, so the pre-step state can be recovered from the store.
         if self.cur_seg_len > 0:
             old_acc = np.copy(self.acc)
-            old_vel = np.copy(self.vel)
-            old_pos = np.copy(self.pos)
+            old_vel = self.vel - (old_acc * dt)
+            old_pos = np.copy(all_bullets.prev_pos[self.slot])
 
-            self.update_pos(dt)
             self.rotate_to_velocity()
-            self.update_rect()
 
             dist = np.sqrt(np.sum((old_pos - self.pos)**2))
             self.cur_seg_len -= dist
@@ -398,5 +451,166 @@ class SegmentedPathBullet(Bullet):
         else:
             self.cur_seg_len = self.segment_len
 
+        self.set_moving(self.cur_seg_len > 0)
+
+
+def steering_target_index(target):
+    for i, t in enumerate(steering_targets):
+        if t is target:
+            return i
+
+    steering_targets.append(target)
+    return len(steering_targets) - 1
+
+def prune_steering_targets(slots):
+    # Drops targets that no live homing bullet (slots) steers towards, so
+    # dead sprites are neither kept alive nor looped over, and renumbers
+    # the rest.
+    if len(slots) == 0:
+        del steering_targets[:]
+        return
+
+    if len(steering_targets) == 1:
+        # Every homing bullet steers towards it.
+        return
+
+    used = np.unique(all_bullets.steer_target[slots])
+    if len(used) == len(steering_targets):
+        return
+
+    remap = np.zeros(len(steering_targets), dtype=np.int32)
+    remap[used] = np.arange(len(used))
+
+    all_bullets.steer_target[slots] = remap[all_bullets.steer_target[slots]]
+    steering_targets[:] = [steering_targets[i] for i in used.tolist()]
+
+def steer_homing_bullets():
+    # Sets the acceleration of every homing bullet in one pass per target:
+    # towards the target, or coasting (acc = vel * 0.1) while it is dead or
+    # the player is respawning.
+    n = all_bullets.size
+    slots = np.flatnonzero(all_bullets.homing[:n])
+
+    prune_steering_targets(slots)
+    if len(slots) == 0:
+        return
+
+    target_indices = all_bullets.steer_target[slots]
+
+    for i, target in enumerate(steering_targets):
+        if len(steering_targets) > 1:
+            sel = slots[target_indices == i]
+        else:
+            sel = slots
+
+        if len(sel) == 0:
+            continue
+
+        if not target.dead and not (target is player and game_data.get_game_state() == 'respawn'):
+            disp_vec = target.pos - all_bullets.pos[sel]
+            dist = np.sqrt(np.sum(disp_vec ** 2, axis=1))
+
+            all_bullets.acc[sel] = (
+                (disp_vec / dist[:, np.newaxis])
+                * all_bullets.steer_acc[sel, np.newaxis]
+            )
+        else:
+            all_bullets.acc[sel] = all_bullets.vel[sel] * 0.1
+
+def update_bullets(dt):
+    global bullet_grid_stale
+
+    # Steering has to see this frame's target positions before the store
+    # integrates everything in one step.
+    steer_homing_bullets()
+    all_bullets.update(dt)
+
+    bullet_grid_stale = True
+
+def spawn_ahead(spawn, dt):
+    # Calls spawn() and moves the bullets it adds dt ahead, as if they had
+    # been spawned dt earlier.
+    all_bullets.spawn_log = []
+    spawn()
+
+    slots = np.array(all_bullets.spawn_log, dtype=np.intp)
+    all_bullets.spawn_log = None
+
+    slots = slots[all_bullets.alive[slots]]
+    if len(slots) > 0:
+        all_bullets.advance(slots, dt)
+
+def clear_bullets():
+    all_bullets.kill_slots(all_bullets.live_slots())
+
+def rebuild_bullet_grid():
+    global bullet_grid_stale
+
+    n = all_bullets.size
+    bullet_grid.rebuild(all_bullets.pos[:n], all_bullets.alive[:n])
+
+    bullet_grid_stale = False
+
+def bullets_near(point, radius):
+    # The grid is rebuilt by the first query after bullets move, so ticks
+    # where nothing queries it don't pay for it.
+    if bullet_grid_stale:
+        rebuild_bullet_grid()
+
+    return [
+        all_bullets.slot_sprites[slot]
+        for slot in bullet_grid.query_radius(point, radius).tolist()
+    ]
+
+def beams_near(point, radius):
+    return [
+        all_beams.slot_sprites[slot]
+        for slot in all_beams.query_radius(point, radius).tolist()
+    ]
+
+def mask_collision(slots):
+    for slot in slots.tolist():
+        bullet = all_bullets.slot_sprites[slot]
+        bullet.update_rect()
+
+        if (
+            player.rect.colliderect(bullet.rect)
+            and pygame.sprite.collide_mask(player, bullet) is not None
+        ):
+            return bullet
+
+    return None
+
+def collision_candidates():
+    # Bullets close enough to the player to be worth a narrow-phase test.
+    # For this one query per tick, a distance test over every bullet costs
+    # less than rebuilding bullet_grid would at any bullet count (see
+    # 'benchmarks.py collision').
+    w, h = player.image.get_size()
+
+    if game_data.mask_collision:
+        # Rects are placed to the nearest pixel.
+        extent = bullet_extent + 2
+    else:
+        extent = hitboxes.bounding_radius
+
+    return all_bullets.slots_near(player.pos, math.hypot(w / 2, h / 2) + extent)
+
+def player_hit(slots):
+    # The first bullet in slots that hits the player, or None.
+    if game_data.mask_collision:
+        return mask_collision(slots)
+
+    w, h = player.image.get_size()
+    hit = hitboxes.collide_box(all_bullets, slots, player.pos, (w / 2, h / 2))
+
+    hit_slots = slots[hit]
+    if len(hit_slots) == 0:
+        return None
+
+    return all_bullets.slot_sprites[hit_slots[0]]
+
+def player_collision():
+    return player_hit(collision_candidates())
 
 player = Player((400, 400), 0)
@@ -0,0 +1,219 @@
+import csv
+import json
+import time
+
+import pygame
+import numpy as np
+
+import game_data
+
+# Stages of one frame of the main loop, in the order they usually run.
+# 'erase' is the dirty-rect renderer restoring last frame's drawing;
+# 'waves' includes advancing the game clock, and 'collision' the response
+# to a hit.
+phases = [
+    'events', 'erase', 'waves', 'entities', 'cull', 'collision',
+    'effects', 'bullet_draw', 'hud', 'flip',
+]
+
+class FrameTimer:
+    # Lap timer for the stages of each frame. mark(phase) charges the time
+    # since the previous mark to phase; a phase that runs several times in a
+    # frame (once per simulation tick, say) adds up. Totals for the last
+    # `frames` frames are kept in a ring buffer, along with when each frame
+    # started and which wave was running.
+
+    def __init__(self, frames, enabled=False):
+        self.enabled = enabled
+        self.capacity = frames
+
+        self.phase_index = dict((phase, i) for i, phase in enumerate(phases))
+
+        self.durations = np.zeros((frames, len(phases)), dtype=np.float64)
+        self.frame_start = np.zeros(frames, dtype=np.float64)
+        self.wave_names = [None] * frames
+
+        # Frames recorded so far; the newest is at (count - 1) % capacity.
+        self.count = 0
+
+        self.current = [0] * len(phases)
+        self.start = 0
+        self.last = 0
+
+        self.overlay = None
+        self.overlay_frame = None
+
+    def enable(self):
+        # Starts timing from now; the frame in progress counts from here.
+        if not self.enabled:
+            self.enabled = True
+            self.begin_frame()
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+
+        self.current = [0] * len(phases)
+        self.start = self.last = time.perf_counter()
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+
+        now = time.perf_counter()
+        self.current[self.phase_index[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self, wave_name=None):
+        if not self.enabled:
+            return
+
+        i = self.count % self.capacity
+
+        self.durations[i] = self.current
+        self.frame_start[i] = self.start
+        self.wave_names[i] = wave_name
+
+        self.count += 1
+
+    def recorded(self):
+        # Ring buffer slots in recording order, oldest first.
+        n = min(self.count, self.capacity)
+        return (np.arange(self.count - n, self.count) % self.capacity)
+
+    def stats(self, window):
+        # Per-phase mean and 99th percentile, in seconds, over the last
+        # `window` frames.
+        slots = self.recorded()[-window:]
+        if len(slots) == 0:
+            return None
+
+        durations = self.durations[slots]
+        totals = durations.sum(axis=1)
+
+        return {
+            'frames': len(slots),
+            'mean': dict(zip(phases, durations.mean(axis=0).tolist())),
+            'p99': dict(zip(phases, np.percentile(durations, 99, axis=0).tolist())),
+            'total_mean': float(totals.mean()),
+            'total_p99': float(np.percentile(totals, 99)),
+        }
+
+    def write_csv(self, path):
+        # One row per recorded frame; times in milliseconds.
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'start_ms', 'wave'] + phases + ['total'])
+
+            first = self.count - len(self.recorded())
+            t0 = None
+
+            for n, slot in enumerate(self.recorded().tolist()):
+                if t0 is None:
+                    t0 = self.frame_start[slot]
+
+                durations = self.durations[slot]
+                writer.writerow(
+                    [first + n, round(1000 * (self.frame_start[slot] - t0), 4), self.wave_names[slot] or '']
+                    + [round(1000 * d, 4) for d in durations.tolist()]
+                    + [round(1000 * durations.sum(), 4)]
+                )
+
+    def write_chrome_trace(self, path):
+        # Trace Event Format, for chrome://tracing or Perfetto. Each frame is
+        # one span with its phases laid end to end inside it; a phase that
+        # ran in pieces shows up as a single span of its total length.
+        events = []
+
+        for slot in self.recorded().tolist():
+            ts = 1e6 * self.frame_start[slot]
+            durations = (1e6 * self.durations[slot]).tolist()
+
+            args = {}
+            if self.wave_names[slot] is not None:
+                args['wave'] = self.wave_names[slot]
+
+            events.append({
+                'name': 'frame', 'ph': 'X', 'pid': 0, 'tid': 0,
+                'ts': ts, 'dur': sum(durations), 'args': args,
+            })
+
+            for phase, dur in zip(phases, durations):
+                if dur > 0:
+                    events.append({
+                        'name': phase, 'ph': 'X', 'pid': 0, 'tid': 0,
+                        'ts': ts, 'dur': dur,
+                    })
+                    ts += dur
+
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def draw_overlay(self, surface, pos, font, window, refresh):
+        # Draws a table of per-phase mean / p99 frame times. The table is
+        # re-rendered every `refresh` frames, not every frame.
+        if self.overlay is None or self.count - self.overlay_frame >= refresh:
+            self.overlay = self.render_overlay(font, window)
+            self.overlay_frame = self.count
+
+        if self.overlay is None:
+            return None
+
+        return surface.blit(self.overlay, pos)
+
+    def render_overlay(self, font, window):
+        stats = self.stats(window)
+        if stats is None:
+            return None
+
+        rows = [("phase", "avg", "p99")]
+        for phase in phases:
+            rows.append((
+                phase,
+                "{:.2f}".format(1000 * stats['mean'][phase]),
+                "{:.2f}".format(1000 * stats['p99'][phase]),
+            ))
+
+        rows.append((
+            "total",
+            "{:.2f}".format(1000 * stats['total_mean']),
+            "{:.2f}".format(1000 * stats['total_p99']),
+        ))
+
+        # The numbers change every time, so they bypass text_cache.
+        color = (255, 255, 255)
+        rendered = [
+            [font.render(text, True, color) for text in row]
+            for row in rows
+        ]
+
+        line_height = font.get_linesize()
+        col_widths = [
+            max(row[col].get_width() for row in rendered) + 10
+            for col in range(3)
+        ]
+
+        overlay = pygame.Surface(
+            (sum(col_widths) + 10, (line_height * len(rows)) + 10),
+            pygame.SRCALPHA
+        )
+        overlay.fill((0, 0, 0, 160))
+
+        for n, row in enumerate(rendered):
+            x = 5
+            for col, text in enumerate(row):
+                if col == 0:
+                    overlay.blit(text, (x, 5 + (n * line_height)))
+                else:
+                    # Numbers are right-aligned.
+                    overlay.blit(text, (
+                        x + col_widths[col] - 10 - text.get_width(),
+                        5 + (n * line_height)
+                    ))
+
+                x += col_widths[col]
+
+        return overlay
+
+
+timer = FrameTimer(game_data.frame_timing_frames, game_data.frame_timing_enabled)
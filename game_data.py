@@ -1,15 +1,73 @@
 import pygame
 
-title_font = pygame.font.Font("aldo_the_apache/AldotheApache.ttf", 150)
-display_font = pygame.font.Font("open_24_display/Open 24 Display St.ttf", 50)
-prompt_font = pygame.font.Font("open_24_display/Open 24 Display St.ttf", 75)
-fps_font = pygame.font.Font("open_24_display/Open 24 Display St.ttf", 25)
-input_font = pygame.font.Font("linear_beam/Linebeam.ttf", 50)
-high_score_font = pygame.font.Font("open_24_display/Open 24 Display St.ttf", 22)
+# Fonts are loaded by load_fonts() once pygame is initialized, so headless
+# runs never need them.
+title_font = None
+display_font = None
+prompt_font = None
+fps_font = None
+input_font = None
+high_score_font = None
 
 screen_dims = (800, 800)
 profiler_enabled = False
 
+# Statistical profiler (sampling_profiler.py): samples the main thread's
+# stack every sampling_interval seconds, grouped by wave, and writes folded
+# stacks to sampling_output on exit. Unlike cProfile it barely changes
+# frame timing.
+sampling_profiler_enabled = False
+sampling_interval = 0.002
+sampling_output = './profile.folded'
+
+# Per-phase frame timing (see frame_timing.py): how many frames the ring
+# buffer holds, whether to show the overlay (F3 toggles it in game), how
+# many frames its averages cover and how often it is re-rendered, and where
+# to export the ring buffer on exit (None to skip).
+frame_timing_enabled = False
+frame_timing_frames = 3600
+frame_timing_overlay = False
+frame_timing_window = 120
+frame_timing_refresh = 15
+frame_timing_csv = None
+frame_timing_trace = None
+
+# Simulation ticks per second of game time, independent of the frame rate,
+# and how many ticks one frame may run to catch up after a slow frame.
+tick_rate = 60
+max_substeps = 5
+
+# Frames drawn per second at most, or 0 for no cap. Drawing is interpolated
+# between ticks, so frame rates above tick_rate still move smoothly.
+frame_rate = 60
+
+# Bullet sprites are pre-rotated to this many headings and shared through
+# sprite_cache.rotation_cache, which holds at most rotation_cache_size images.
+rotation_steps = 64
+rotation_cache_size = 2048
+
+# Number of (shape, color) bullet base images kept by sprite_cache.base_images.
+base_image_cache_size = 256
+
+# Number of rendered text surfaces kept by text_cache.labels.
+text_cache_size = 256
+
+# The frame is presented with a full flip instead of per-rect updates when
+# the changed area passes this fraction of the window, or this many rects.
+dirty_rect_full_flip = 0.5
+dirty_rect_max_rects = 400
+
+# Where high scores are kept: 'sqlite' (score_db_path) or 'csv'
+# (score_csv_path, rewritten on every save). The SQLite store imports
+# score_csv_path the first time it sees it.
+score_backend = 'sqlite'
+score_csv_path = './scores.csv'
+score_db_path = './scores.db'
+
+# Test collisions against sprite masks instead of the analytic hitboxes in
+# hitboxes.py. Slower; meant for validating the hitbox shapes.
+mask_collision = False
+
 game_running = False
 game_ending = False
 game_paused = False
@@ -42,6 +100,32 @@ respawn_timer = 0
 # 0 = easy, 1 = normal, 2 = hard
 difficulty = 1
 
+# Headless runs replace these with simulated key state and a simulated
+# millisecond clock; see get_pressed() and get_ticks().
+key_state = None
+sim_ticks = None
+
+def load_fonts():
+    global title_font, display_font, prompt_font, fps_font, input_font
+    global high_score_font
+
+    title_font = pygame.font.Font("aldo_the_apache/AldotheApache.ttf", 150)
+    display_font = pygame.font.Font("open_24_display/Open 24 Display St.ttf", 50)
+    prompt_font = pygame.font.Font("open_24_display/Open 24 Display St.ttf", 75)
+    fps_font = pygame.font.Font("open_24_display/Open 24 Display St.ttf", 25)
+    input_font = pygame.font.Font("linear_beam/Linebeam.ttf", 50)
+    high_score_font = pygame.font.Font("open_24_display/Open 24 Display St.ttf", 22)
+
+def get_pressed():
+    if key_state is not None:
+        return key_state
+    return pygame.key.get_pressed()
+
+def get_ticks():
+    if sim_ticks is not None:
+        return sim_ticks
+    return pygame.time.get_ticks()
+
 def reset():
     global t, score, current_wave_number, game_ending, game_running
     global game_end_time, lives, respawn_timer
@@ -92,7 +176,7 @@ def update_time_dilation(actual_dt):
     global time_dilation, low_speed, _td_lo_to_hi_speed, time_dilation_usage
     global time_dilation_must_recharge, respawn_timer
 
-    pressed = pygame.key.get_pressed()
+    pressed = get_pressed()
 
     if (
         (get_game_state() == 'gameplay' or (get_game_state() == 'respawn' and respawn_timer < 3))
@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import random
+import hashlib
+import argparse
+import contextlib
+
+import pygame
+import numpy as np
+
+import entities
+import game_data
+import simulation
+
+# Runs the game logic without a window, fonts or wall clock: fixed dt,
+# seeded RNG, simulated input. Two runs with the same arguments produce
+# bit-identical results.
+
+class KeyState:
+    # Stands in for pygame.key.get_pressed().
+
+    def __init__(self):
+        self.pressed = set()
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+class RandomWalkBot:
+    # Holds a random combination of movement keys for hold_time seconds at a
+    # time. Uses its own RNG so it does not perturb wave generation.
+    directions = [
+        (), (pygame.K_LEFT,), (pygame.K_RIGHT,), (pygame.K_UP,), (pygame.K_DOWN,),
+        (pygame.K_LEFT, pygame.K_UP), (pygame.K_LEFT, pygame.K_DOWN),
+        (pygame.K_RIGHT, pygame.K_UP), (pygame.K_RIGHT, pygame.K_DOWN),
+    ]
+
+    def __init__(self, seed, hold_time=0.25):
+        self.rng = random.Random(seed)
+        self.hold_time = hold_time
+        self.t = 0
+
+    def update(self, keys, dt):
+        self.t -= dt
+
+        if self.t <= 0:
+            self.t = self.hold_time
+            keys.pressed = set(self.rng.choice(self.directions))
+
+
+def state_digest():
+    slots = entities.all_bullets.live_slots()
+
+    h = hashlib.sha1()
+    h.update(np.array((
+        game_data.score, game_data.t, game_data.current_wave_number,
+        game_data.lives
+    ), dtype=np.float64).tobytes())
+    h.update(entities.player.pos.astype(np.float64).tobytes())
+    h.update(entities.all_bullets.pos[slots].tobytes())
+    h.update(entities.all_bullets.vel[slots].tobytes())
+
+    return h.hexdigest()
+
+def run(seed=0, difficulty=1, duration=120, dt=1/60, bot=None, tick_rate=None):
+    random.seed(seed)
+
+    keys = KeyState()
+    game_data.key_state = keys
+    game_data.sim_ticks = 0
+    game_data.difficulty = difficulty
+
+    scheduler = simulation.step_scheduler
+    scheduler.set_tick_rate(tick_rate or game_data.tick_rate)
+
+    simulation.new_game()
+
+    sim_time = 0
+    frames = 0
+    deaths = 0
+
+    def tick(tick_dt):
+        nonlocal deaths
+
+        if simulation.tick(tick_dt) is not None:
+            deaths += 1
+
+    while game_data.game_running and sim_time < duration:
+        if bot is not None:
+            bot.update(keys, dt)
+
+        game_data.sim_ticks = int(round(sim_time * 1000))
+
+        # Same order as the frame loop in curtainfire.py.
+        time_dilation = game_data.time_dilation
+        game_data.update_time_dilation(dt)
+        scheduler.advance(dt, time_dilation, tick)
+
+        sim_time += dt
+        frames += 1
+
+    return {
+        'seed': seed,
+        'difficulty': difficulty,
+        'frames': frames,
+        'ticks': scheduler.ticks,
+        'dropped_time': scheduler.dropped_time,
+        'sim_time': sim_time,
+        'game_time': game_data.t,
+        'game_over': not game_data.game_running,
+        'score': game_data.score,
+        'waves': game_data.current_wave_number,
+        'lives': game_data.lives,
+        'deaths': deaths,
+        'live_bullets': len(entities.all_bullets),
+        'digest': state_digest(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run CurtainFire without a display")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--difficulty', type=int, choices=(0, 1, 2), default=1)
+    parser.add_argument('--duration', type=float, default=120, help="simulated seconds")
+    parser.add_argument('--dt', type=float, default=1/60, help="fixed frame time")
+    parser.add_argument('--tick-rate', type=float, help="simulation ticks per second (default: game_data.tick_rate)")
+    parser.add_argument('--bot', choices=('idle', 'random'), default='random')
+    parser.add_argument('--verify', action='store_true', help="run twice and compare results")
+    parser.add_argument('--verbose', action='store_true', help="keep the game's own log output")
+    args = parser.parse_args()
+
+    def run_once():
+        bot = None
+        if args.bot == 'random':
+            bot = RandomWalkBot(args.seed)
+
+        if args.verbose:
+            return run(args.seed, args.difficulty, args.duration, args.dt, bot, args.tick_rate)
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return run(args.seed, args.difficulty, args.duration, args.dt, bot, args.tick_rate)
+
+    result = run_once()
+    print(json.dumps(result, indent=2))
+
+    if args.verify:
+        second = run_once()
+        if second != result:
+            print("Runs differ!")
+            print(json.dumps(second, indent=2))
+            sys.exit(1)
+
+        print("Second run identical.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import numpy as np
+import bullet_store
+
+# Convex polygons in sprite-local coordinates, centered on the sprite image
+# and pointing along +x (heading 0). Concave shapes are split into convex
+# parts.
+polygon_shapes = {
+    bullet_store.KIND_TRIANGLE: [
+        [(-10, -5), (-10, 5), (10, 0)],
+    ],
+    bullet_store.KIND_ARROWHEAD: [
+        [(-10, -5), (-5, 0), (10, 0)],
+        [(-5, 0), (-10, 5), (10, 0)],
+    ],
+    bullet_store.KIND_DIAMOND: [
+        [(-10, 0), (0, -5), (10, 0), (0, 5)],
+    ],
+}
+
+# MarkerBullet is a 3px ring of radius 10 around a dot of radius 3.
+ring_outer_radius = 10
+ring_inner_radius = 7
+ring_dot_radius = 3
+
+def _build_tables():
+    # Per-kind tables indexed by (kind, part, vertex or edge). Every kind is
+    # padded to the same number of parts and vertices by repeating its last
+    # part / last vertex; repeated vertices give zero-length edges, which
+    # never separate anything. Rings get an empty placeholder and are tested
+    # as circles instead.
+    n_kinds = bullet_store.KIND_RING + 1
+    n_parts = max(len(polys) for polys in polygon_shapes.values())
+    n_verts = max(len(poly) for polys in polygon_shapes.values() for poly in polys)
+
+    verts = np.zeros((n_kinds, n_parts, n_verts, 2), dtype=np.float64)
+
+    for kind, polys in polygon_shapes.items():
+        for part in range(n_parts):
+            poly = polys[min(part, len(polys) - 1)]
+
+            verts[kind, part, :len(poly)] = poly
+            verts[kind, part, len(poly):] = poly[-1]
+
+    edges = np.roll(verts, -1, axis=2) - verts
+    normals = np.stack((-edges[..., 1], edges[..., 0]), axis=3)
+
+    proj = np.einsum('kpad,kpvd->kpav', normals, verts)
+
+    return verts, normals, proj.min(axis=3), proj.max(axis=3)
+
+_verts, _normals, _proj_min, _proj_max = _build_tables()
+
+# Radius of a circle around the sprite center that contains every shape.
+bounding_radius = max(
+    ring_outer_radius, np.sqrt(np.max(np.sum(_verts ** 2, axis=3)))
+)
+
+def circles_hit_box(centers, radius, box_center, box_half, inner_radius=0):
+    # Circles (or annuli, with inner_radius > 0) against one axis-aligned box.
+    disp = np.abs(centers - box_center)
+
+    nearest = np.maximum(disp - box_half, 0)
+    hit = np.sum(nearest ** 2, axis=1) <= radius ** 2
+
+    if inner_radius > 0:
+        # Misses if the whole box fits inside the hole.
+        farthest = disp + box_half
+        hit &= np.sum(farthest ** 2, axis=1) >= inner_radius ** 2
+
+    return hit
+
+# (steps, box half width, box half height) -> separating axis tables for
+# that box against every kind at every heading bucket.
+_sat_tables = {}
+
+def sat_tables(steps, box_half):
+    # Each part's edge normals turned to every heading, followed by the
+    # world x and y axes, as [kind * steps + heading, part * axis, xy]. A
+    # part and the box are separated on an axis when the box center
+    # projects outside limits[..., 0]-limits[..., 1] on it: the part's own
+    # projection widened by the box's.
+    key = (steps, box_half[0], box_half[1])
+
+    tables = _sat_tables.get(key)
+    if tables is not None:
+        return tables
+
+    angles = np.arange(steps) * (2 * np.pi / steps)
+    cos = np.cos(angles)[np.newaxis, :, np.newaxis, np.newaxis]
+    sin = np.sin(angles)[np.newaxis, :, np.newaxis, np.newaxis]
+
+    nx = _normals[:, np.newaxis, ..., 0]
+    ny = _normals[:, np.newaxis, ..., 1]
+    nx, ny = (nx * cos) - (ny * sin), (nx * sin) + (ny * cos)
+
+    vx = _verts[:, np.newaxis, ..., 0]
+    vy = _verts[:, np.newaxis, ..., 1]
+    x = (vx * cos) - (vy * sin)
+    y = (vx * sin) + (vy * cos)
+
+    shape = nx.shape[:3] + (1,)
+    ones = np.ones(shape)
+    zeros = np.zeros(shape)
+
+    normals = np.stack((
+        np.concatenate((nx, ones, zeros), axis=3),
+        np.concatenate((ny, zeros, ones), axis=3),
+    ), axis=4)
+
+    proj_min = np.concatenate((
+        np.broadcast_to(_proj_min[:, np.newaxis], nx.shape),
+        x.min(axis=3, keepdims=True), y.min(axis=3, keepdims=True),
+    ), axis=3)
+    proj_max = np.concatenate((
+        np.broadcast_to(_proj_max[:, np.newaxis], nx.shape),
+        x.max(axis=3, keepdims=True), y.max(axis=3, keepdims=True),
+    ), axis=3)
+
+    box_radius = np.dot(np.abs(normals), box_half)
+    limits = np.stack((proj_min - box_radius, proj_max + box_radius), axis=4)
+
+    n = len(_normals) * steps
+    n_axes = normals.shape[2] * normals.shape[3]
+    tables = _sat_tables[key] = (
+        normals.reshape((n, n_axes, 2)),
+        limits.reshape((n, n_axes, 2)),
+    )
+    return tables
+
+def polygons_hit_box(kinds, headings, centers, box_center, box_half, steps):
+    # Separating axis test of every polygon part against the box.
+    normals, limits = sat_tables(steps, box_half)
+
+    # kinds is int8, so widen it before it can overflow.
+    index = (kinds.astype(np.intp) * steps) + headings
+    limits = limits[index]
+
+    disp = box_center - centers
+    center_proj = np.matmul(normals[index], disp[:, :, np.newaxis])[..., 0]
+
+    separated = center_proj < limits[..., 0]
+    separated |= center_proj > limits[..., 1]
+
+    # A part is missed if any axis separates it; the shape if every part is.
+    separated = separated.reshape((len(index), _normals.shape[1], -1))
+    separated = np.logical_or.reduce(separated, axis=2)
+    return ~np.logical_and.reduce(separated, axis=1)
+
+def shapes_hit_box(store, slots, box_center, box_half):
+    kinds = store.kind[slots]
+    centers = store.pos[slots]
+
+    hit = polygons_hit_box(
+        kinds, store.heading[slots], centers, box_center, box_half,
+        store.heading_steps
+    )
+
+    rings = kinds == bullet_store.KIND_RING
+    if np.count_nonzero(rings) > 0:
+        hit[rings] = (
+            circles_hit_box(
+                centers[rings], ring_outer_radius, box_center, box_half,
+                ring_inner_radius
+            )
+            | circles_hit_box(
+                centers[rings], ring_dot_radius, box_center, box_half
+            )
+        )
+
+    return hit
+
+def collide_box(store, slots, box_center, box_half):
+    # For each bullet slot, whether its hitbox overlaps the box. Bullets are
+    # oriented by their heading bucket, matching the sprite that is drawn.
+    if len(slots) == 0:
+        return np.zeros(0, dtype=bool)
+
+    box_center = np.asarray(box_center, dtype=np.float64)
+    box_half = (float(box_half[0]), float(box_half[1]))
+
+    return shapes_hit_box(store, slots, box_center, box_half)
@@ -0,0 +1,127 @@
+import pygame
+import game_data
+import text_cache
+import scores
+
+class SidebarLayer:
+    # The sidebar: high score panel plus, during a game, the lives counter
+    # and time dilation readout. Composed onto a persistent surface that is
+    # only redrawn when something it shows has changed.
+
+    # Sidebar-local area holding the lives counter and time dilation readout.
+    status_top = 560
+    status_height = 200
+
+    def __init__(self):
+        self.surface = None
+        self.state = None
+        self.redraws = 0
+
+        self.status_rect = pygame.Rect(
+            (0, self.status_top), (game_data.hs_screen_width, self.status_height)
+        )
+
+    def current_state(self):
+        panel = scores.render_high_scores()
+
+        if not game_data.game_running:
+            return (panel,)
+
+        max_td_bar_size = game_data.hs_screen_width - 40
+        cur_td_bar_size = int(
+            max_td_bar_size
+            * game_data.time_dilation_usage
+            / game_data.time_dilation_max
+        )
+
+        return (
+            panel,
+            game_data.lives,
+            cur_td_bar_size,
+            game_data.time_dilation_must_recharge,
+            "{:.2f}".format(game_data.time_dilation),
+        )
+
+    def redraw(self, state):
+        # Returns the sidebar-local rect that changed.
+        if self.surface is None:
+            self.surface = pygame.Surface(
+                (game_data.hs_screen_width, game_data.screen_dims[1])
+            )
+
+        if self.state is None or state[0] is not self.state[0]:
+            changed = self.surface.blit(state[0], (0, 0))
+        else:
+            # Only the status area changed; restore the panel under it.
+            changed = self.surface.blit(
+                state[0], self.status_rect, self.status_rect
+            )
+
+        if len(state) > 1:
+            self.draw_status(*state[1:])
+
+        self.state = state
+        self.redraws += 1
+
+        return changed
+
+    def draw_status(self, lives, cur_td_bar_size, must_recharge, td_text):
+        surface = self.surface
+
+        # Positions are in screen coordinates, shifted onto the sidebar.
+        x0 = -game_data.screen_dims[0]
+
+        # Render display segment title
+        t = text_cache.labels.render(
+            game_data.display_font, "Lives: ", True, (255, 255, 255)
+        )
+
+        w, h = t.get_size()
+        surface.blit(t, (x0 + 815, 740 - h))
+
+        # Render lives count in white normally, use red if last life
+        color = (255, 255, 255, 255)
+        if lives == 0:
+            color = (255, 0, 0, 255)
+
+        c = text_cache.labels.render(
+            game_data.display_font, "{:01n}".format(lives), True, color
+        )
+        surface.blit(c, (x0 + 815 + h + 65, 740 - h))
+
+        # Render time dilation constant
+        fps_atlas = text_cache.atlas(game_data.fps_font, (255, 255, 255))
+
+        w, h = fps_atlas.size(td_text, "Time Dilation: ")
+        fps_atlas.draw(surface, td_text, (
+            x0 + 800 + (game_data.hs_screen_width / 2) - (w / 2), 640 - h
+        ), "Time Dilation: ")
+
+        # Render time dilation usage bar
+        max_td_bar_size = game_data.hs_screen_width - 40
+
+        bar_bg = pygame.Rect((x0 + 820, 650), (max_td_bar_size, 20))
+        bar_fg = pygame.Rect((x0 + 820, 650), (cur_td_bar_size, 20))
+
+        pygame.draw.rect(surface, (192, 192, 192), bar_bg)
+
+        if must_recharge:
+            pygame.draw.rect(surface, (255, 0, 0), bar_fg)
+        else:
+            pygame.draw.rect(surface, (0, 0, 255), bar_fg)
+
+    def draw(self, target):
+        # Brings the sidebar on target (a screen-sized surface) up to date
+        # and returns the screen rect that changed, or None.
+        state = self.current_state()
+        if state == self.state:
+            return None
+
+        changed = self.redraw(state)
+
+        return target.blit(
+            self.surface, changed.move(game_data.screen_dims[0], 0), changed
+        )
+
+
+sidebar = SidebarLayer()
@@ -0,0 +1,234 @@
+import os
+import csv
+import sys
+import time
+import heapq
+import argparse
+
+import score_store
+
+# Merges score files collected from several cabinets into global and
+# per-difficulty top-N lists. Each file yields only its own top N per list,
+# so memory does not grow with the number of rows; the per-file lists are
+# then k-way merged. Files are either scores.csv files, streamed once, or
+# scores.db files from the SQLite store, read best first through its
+# indexes until the lists are full.
+
+difficulty_names = {0: 'easy', 1: 'normal', 2: 'hard'}
+
+def score_key(score):
+    # Rows that are the same score, e.g. from a file collected twice.
+    return tuple(score[field] for field in score_store.score_fields)
+
+def offer(board, seen, score, stats):
+    # Leaderboard.insert(), but skipping scores the board already holds.
+    key = score_key(score)
+    if key in seen:
+        stats['duplicates'] += 1
+        return
+
+    evicted = None
+    if len(board.scores) == board.k:
+        evicted = board.scores[-1]
+
+    if board.insert(score):
+        seen.add(key)
+
+        if evicted is not None:
+            seen.discard(score_key(evicted))
+
+def read_file(path, n, dedup, stats):
+    # The top n scores in one file, overall and per difficulty, as
+    # {None or difficulty: best-first list}.
+    boards = {}
+    seen = {}
+
+    def board(difficulty):
+        if difficulty not in boards:
+            boards[difficulty] = score_store.Leaderboard(n)
+            seen[difficulty] = set()
+        return boards[difficulty]
+
+    overall = board(None)
+
+    with open(path, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+
+        header = next(reader, [])
+        columns = dict((name, i) for i, name in enumerate(header))
+
+        score_column = columns.get('score')
+        difficulty_column = columns.get('difficulty')
+
+        for row in reader:
+            stats['rows'] += 1
+
+            # Only the score and difficulty are parsed up front; most rows
+            # make neither list and are skipped after two comparisons.
+            try:
+                value = int(row[score_column])
+                difficulty = 1
+                if difficulty_column is not None:
+                    difficulty = int(row[difficulty_column])
+            except (IndexError, TypeError, ValueError):
+                stats['bad_rows'] += 1
+                continue
+
+            if (
+                value <= overall.threshold
+                and value <= board(difficulty).threshold
+            ):
+                continue
+
+            try:
+                score = score_store.parse_row(dict(zip(header, row)))
+            except (KeyError, TypeError, ValueError):
+                stats['bad_rows'] += 1
+                continue
+
+            for d in (None, score['difficulty']):
+                if dedup:
+                    offer(board(d), seen[d], score, stats)
+                else:
+                    board(d).insert(score)
+
+    return dict((difficulty, b.scores) for difficulty, b in boards.items())
+
+def read_db(path, n, dedup, stats):
+    # Same as read_file(), for a scores.db file. Each list is read best
+    # first and stops at the first score that can't make it.
+    if not os.path.exists(path):
+        raise FileNotFoundError("No such score database: {}".format(path))
+
+    store = score_store.SQLiteScoreStore(path, read_only=True)
+
+    lists = {}
+    for difficulty in [None] + store.difficulties():
+        board = score_store.Leaderboard(n)
+        seen = set()
+
+        for score in store.iter_scores(difficulty):
+            stats['rows'] += 1
+
+            if score['score'] <= board.threshold:
+                break
+
+            if dedup:
+                offer(board, seen, score, stats)
+            else:
+                board.insert(score)
+
+        lists[difficulty] = board.scores
+
+    store.close()
+    return lists
+
+def read_scores(path, n, dedup, stats):
+    if path.endswith('.db'):
+        return read_db(path, n, dedup, stats)
+
+    return read_file(path, n, dedup, stats)
+
+def merge(lists, n, dedup, stats):
+    # k-way merge of best-first lists; ties keep file order.
+    merged = []
+    seen = set()
+
+    for score in heapq.merge(*lists, key=lambda s: -s['score']):
+        if dedup:
+            key = score_key(score)
+            if key in seen:
+                stats['duplicates'] += 1
+                continue
+            seen.add(key)
+
+        merged.append(score)
+        if len(merged) >= n:
+            break
+
+    return merged
+
+def merge_files(paths, n, dedup=True):
+    # Returns ({None or difficulty: top n}, stats).
+    stats = {'files': 0, 'rows': 0, 'bad_rows': 0, 'duplicates': 0}
+
+    per_file = []
+    for path in paths:
+        per_file.append(read_scores(path, n, dedup, stats))
+        stats['files'] += 1
+
+    difficulties = set()
+    for lists in per_file:
+        difficulties.update(lists.keys())
+
+    results = {}
+    for difficulty in sorted(difficulties, key=lambda d: -1 if d is None else d):
+        results[difficulty] = merge(
+            [lists[difficulty] for lists in per_file if difficulty in lists],
+            n, dedup, stats
+        )
+
+    return results, stats
+
+def list_name(difficulty):
+    if difficulty is None:
+        return 'all'
+    return difficulty_names.get(difficulty, str(difficulty))
+
+def print_results(results):
+    for difficulty, scores in results.items():
+        print("Top {} ({}):".format(len(scores), list_name(difficulty)))
+
+        for i, s in enumerate(scores):
+            print("{:>4}. {:<16} {:05n} - {:.3f} - {:02n} - {}".format(
+                i+1, s['name'], s['score'], s['time'], s['waves'],
+                list_name(s['difficulty'])
+            ))
+
+        print()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge score files into global and per-difficulty top-N lists"
+    )
+    parser.add_argument(
+        'files', nargs='+', help="scores.csv or scores.db (SQLite store) files to merge"
+    )
+    parser.add_argument('-n', '--top', type=int, default=10, help="scores per list")
+    parser.add_argument(
+        '--keep-duplicates', action='store_true',
+        help="don't drop rows that appear more than once"
+    )
+    parser.add_argument(
+        '--output-dir',
+        help="write scores.csv (all difficulties) and scores_<difficulty>.csv here"
+    )
+    parser.add_argument('--quiet', action='store_true', help="don't print the lists")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results, stats = merge_files(args.files, args.top, not args.keep_duplicates)
+    elapsed = time.perf_counter() - start
+
+    if not args.quiet:
+        print_results(results)
+
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+        for difficulty, scores in results.items():
+            name = 'scores.csv'
+            if difficulty is not None:
+                name = 'scores_{}.csv'.format(list_name(difficulty))
+
+            score_store.write_csv(scores, os.path.join(args.output_dir, name))
+
+    print(
+        "Merged {} files in {:.2f} s ({} rows read, {} bad rows, {} duplicate list entries dropped).".format(
+            stats['files'], elapsed, stats['rows'], stats['bad_rows'], stats['duplicates']
+        ),
+        file=sys.stderr
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import pygame
+
+class DirtyRectRenderer:
+    # Redraws and presents only the parts of the screen that changed.
+    #
+    # Everything drawn during a frame is recorded through blit() / add().
+    # At the start of the next frame those rects are restored from the
+    # background (black play area plus the cached sidebar), so nothing is
+    # left behind, and only the old and new rects are sent to the display.
+    # When they cover more than full_flip_fraction of the screen, or more
+    # than max_rects rects, the whole screen is flipped instead.
+
+    def __init__(self, screen, full_flip_fraction, max_rects):
+        self.screen = screen
+        self.full_flip_fraction = full_flip_fraction
+        self.max_rects = max_rects
+
+        self.background = pygame.Surface(screen.get_size())
+        self.background.fill((0, 0, 0))
+
+        self.drawn = []
+        self.dirty = []
+        self.full_redraw = True
+
+        self.frames = 0
+        self.full_flips = 0
+        self.dirty_fraction = 1
+
+    def invalidate(self):
+        # Repaint and present the whole screen next frame.
+        self.full_redraw = True
+
+    def begin_frame(self):
+        if self.full_redraw:
+            self.screen.blit(self.background, (0, 0))
+            self.dirty = []
+        else:
+            # Erase last frame's drawing; those areas need presenting too.
+            for rect in self.drawn:
+                self.screen.blit(self.background, rect, rect)
+
+            self.dirty = self.drawn
+
+        self.drawn = []
+
+    def restore(self, rect):
+        # The background changed inside rect.
+        self.screen.blit(self.background, rect, rect)
+        self.dirty.append(rect)
+
+    def blit(self, source, dest, area=None):
+        rect = self.screen.blit(source, dest, area)
+        self.drawn.append(rect)
+        return rect
+
+    def add(self, rects):
+        self.drawn.extend(rects)
+
+    def present(self):
+        rects = self.dirty + self.drawn
+
+        screen_w, screen_h = self.screen.get_size()
+        area = sum(r.w * r.h for r in rects)
+        self.dirty_fraction = area / (screen_w * screen_h)
+
+        if (
+            self.full_redraw
+            or self.dirty_fraction > self.full_flip_fraction
+            or len(rects) > self.max_rects
+        ):
+            pygame.display.flip()
+            self.full_flips += 1
+        else:
+            pygame.display.update(rects)
+
+        self.full_redraw = False
+        self.frames += 1
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'full_flips': self.full_flips,
+            'last_dirty_fraction': self.dirty_fraction,
+        }
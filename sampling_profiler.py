@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import threading
+
+class SamplingProfiler:
+    # Statistical profiler: a background thread wakes every `interval`
+    # seconds and records the main thread's call stack. Unlike cProfile,
+    # nothing is added to the calls being measured, so the game runs at
+    # close to its normal speed while it is sampled.
+    #
+    # Samples are grouped by label(), called from the sampler thread at each
+    # sample (the running wave's name, say), and written out in the folded
+    # stack format that flame graph tools read.
+
+    def __init__(self, interval, label=None, thread_id=None):
+        self.interval = interval
+        self.label = label
+
+        if thread_id is None:
+            thread_id = threading.main_thread().ident
+        self.thread_id = thread_id
+
+        # label -> tuple of code objects, outermost first -> sample count.
+        self.samples = {}
+        self.n_samples = 0
+
+        # Time the sampler itself spent taking samples.
+        self.overhead = 0
+
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        if self.thread is not None:
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="sampling-profiler", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            start = time.perf_counter()
+            self.sample()
+            self.overhead += time.perf_counter() - start
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+
+        label = None
+        if self.label is not None:
+            try:
+                label = self.label()
+            except Exception:
+                # The main thread may be halfway through changing whatever
+                # label() looks at.
+                pass
+
+        counts = self.samples.setdefault(label, {})
+        stack = tuple(stack)
+        counts[stack] = counts.get(stack, 0) + 1
+
+        self.n_samples += 1
+
+    def summary(self):
+        # Sample count per label, most sampled first.
+        return sorted(
+            ((label, sum(counts.values())) for label, counts in self.samples.items()),
+            key=lambda item: item[1], reverse=True
+        )
+
+    def write_folded(self, path):
+        # One "label;outer;...;inner count" line per distinct stack. Samples
+        # taken with no label have no label frame.
+        names = {}
+
+        def frame_name(code):
+            name = names.get(code)
+            if name is None:
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                name = names[code] = "{}.{}".format(
+                    module, getattr(code, 'co_qualname', code.co_name)
+                )
+            return name
+
+        with open(path, 'w') as f:
+            for label, counts in self.samples.items():
+                for stack, count in counts.items():
+                    frames = [frame_name(code) for code in stack]
+                    if label is not None:
+                        frames.insert(0, str(label))
+
+                    f.write("{} {}\n".format(';'.join(frames), count))
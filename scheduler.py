@@ -0,0 +1,48 @@
+class FixedStepScheduler:
+    # Accumulates game time (wall time scaled by time dilation) and runs the
+    # simulation in fixed ticks, independent of the render frame rate. At
+    # most max_substeps ticks run per frame; time beyond that is dropped so a
+    # slow frame can't snowball into ever longer catch-up frames.
+
+    def __init__(self, tick_rate, max_substeps):
+        self.set_tick_rate(tick_rate)
+        self.max_substeps = max_substeps
+
+        self.accumulator = 0
+        self.ticks = 0
+        self.dropped_time = 0
+
+    def set_tick_rate(self, tick_rate):
+        self.tick_rate = tick_rate
+        self.tick_dt = 1 / tick_rate
+
+    def reset(self):
+        self.accumulator = 0
+        self.ticks = 0
+        self.dropped_time = 0
+
+    def advance(self, actual_dt, time_dilation, tick):
+        # Runs tick(dt) as many times as the elapsed game time allows and
+        # returns how many ticks ran.
+        self.accumulator += actual_dt * time_dilation
+
+        steps = 0
+        while self.accumulator >= self.tick_dt:
+            if steps >= self.max_substeps:
+                dropped = self.accumulator - (self.accumulator % self.tick_dt)
+
+                self.dropped_time += dropped
+                self.accumulator -= dropped
+                break
+
+            tick(self.tick_dt)
+
+            self.accumulator -= self.tick_dt
+            self.ticks += 1
+            steps += 1
+
+        return steps
+
+    def alpha(self):
+        # How far the current frame is between the last tick and the next.
+        return self.accumulator / self.tick_dt
@@ -0,0 +1,339 @@
+import os
+import csv
+import time
+import queue
+import bisect
+import sqlite3
+import threading
+import urllib.parse
+
+score_fields = [
+    'name',
+    'timestamp',
+    'score',
+    'time',
+    'waves',
+    'difficulty'
+]
+
+def parse_row(row):
+    return {
+        'name': row['name'],
+        'timestamp': row['timestamp'],
+        'score': int(row['score']),
+        'time': float(row['time']),
+        'waves': int(row['waves']),
+        'difficulty': int(row.get('difficulty', 1))
+    }
+
+def read_csv(path):
+    # Every score in a scores.csv file, best first; [] if there is none.
+    try:
+        with open(path, newline='') as csvfile:
+            reader = csv.DictReader(csvfile)
+            return sorted(
+                [parse_row(row) for row in reader],
+                key=lambda v: v['score'],
+                reverse=True
+            )
+    except FileNotFoundError as e:
+        print("Could not find scores file!")
+        return []
+
+def write_csv(score_list, path):
+    # Written to a temporary file that replaces path once complete, so a
+    # crash mid-write never leaves a truncated scores file behind.
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, score_fields)
+
+        writer.writeheader()
+        writer.writerows(score_list)
+
+        csvfile.flush()
+        os.fsync(csvfile.fileno())
+
+    os.replace(tmp_path, path)
+
+
+class Leaderboard:
+    # The best k scores, best first, kept sorted by bisect insertion. The
+    # score a new one has to beat is cached in threshold, so checking for a
+    # high score is one comparison.
+
+    def __init__(self, k, scores=()):
+        self.k = k
+
+        # Best first; keys holds the negated scores in the same order so
+        # bisect can search it.
+        self.scores = []
+        self.keys = []
+        self.update_threshold()
+
+        for score in scores:
+            self.insert(score)
+
+    def update_threshold(self):
+        if len(self.scores) < self.k:
+            # Any score makes it onto a board that isn't full.
+            self.threshold = float('-inf')
+        else:
+            self.threshold = self.scores[-1]['score']
+
+    def insert(self, score):
+        # Returns whether score made the board. Ties go after the scores
+        # already there, like the stores order them.
+        key = -score['score']
+        i = bisect.bisect_right(self.keys, key)
+        if i >= self.k:
+            return False
+
+        self.keys.insert(i, key)
+        self.scores.insert(i, score)
+
+        if len(self.scores) > self.k:
+            del self.keys[self.k:]
+            del self.scores[self.k:]
+
+        self.update_threshold()
+        return True
+
+
+class CSVScoreStore:
+    # The original storage: every score held in memory and the whole file
+    # rewritten on each save.
+
+    def __init__(self, path):
+        self.path = path
+        self.scores = read_csv(path)
+
+    def count(self):
+        return len(self.scores)
+
+    def top(self, n, difficulty=None):
+        scores = self.scores
+        if difficulty is not None:
+            scores = [s for s in scores if s['difficulty'] == difficulty]
+
+        return scores[:n]
+
+    def add(self, score):
+        # Kept sorted, so there is no need to re-sort everything.
+        bisect.insort(self.scores, score, key=lambda v: -v['score'])
+
+        write_csv(self.scores, self.path)
+
+    def close(self):
+        pass
+
+
+class SQLiteScoreStore:
+    # Scores in an SQLite database, indexed so that adding a score is one
+    # B-tree insert and a top-N query reads N index entries, however long
+    # the history gets. Ties keep insertion order, like the stable sort of
+    # the CSV store.
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+
+        if read_only:
+            # For reading someone else's database: nothing is created or
+            # changed, and a missing file is an error.
+            self.db = sqlite3.connect(
+                'file:{}?mode=ro'.format(urllib.parse.quote(os.path.abspath(path))),
+                uri=True
+            )
+            return
+
+        self.db = sqlite3.connect(path)
+
+        # WAL makes each save an append to the log instead of a rewrite of
+        # the pages it touches, and readers never wait on it.
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "id INTEGER PRIMARY KEY, name TEXT, timestamp TEXT, "
+                "score INTEGER, time REAL, waves INTEGER, difficulty INTEGER)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS scores_by_score "
+                "ON scores (score DESC)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS scores_by_difficulty "
+                "ON scores (difficulty, score DESC)"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS imported_files (path TEXT PRIMARY KEY)"
+            )
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def top(self, n, difficulty=None):
+        columns = ', '.join(score_fields)
+
+        if difficulty is None:
+            rows = self.db.execute(
+                "SELECT {} FROM scores ORDER BY score DESC, id LIMIT ?".format(columns),
+                (n,)
+            )
+        else:
+            rows = self.db.execute(
+                "SELECT {} FROM scores WHERE difficulty = ? "
+                "ORDER BY score DESC, id LIMIT ?".format(columns),
+                (difficulty, n)
+            )
+
+        return [dict(zip(score_fields, row)) for row in rows]
+
+    def difficulties(self):
+        return [
+            row[0] for row in
+            self.db.execute("SELECT DISTINCT difficulty FROM scores ORDER BY difficulty")
+        ]
+
+    def iter_scores(self, difficulty=None):
+        # Every score, best first, streamed in index order.
+        columns = ', '.join(score_fields)
+
+        if difficulty is None:
+            rows = self.db.execute(
+                "SELECT {} FROM scores ORDER BY score DESC, id".format(columns)
+            )
+        else:
+            rows = self.db.execute(
+                "SELECT {} FROM scores WHERE difficulty = ? "
+                "ORDER BY score DESC, id".format(columns),
+                (difficulty,)
+            )
+
+        for row in rows:
+            yield dict(zip(score_fields, row))
+
+    def insert(self, scores):
+        self.db.executemany(
+            "INSERT INTO scores ({}) VALUES ({})".format(
+                ', '.join(score_fields), ', '.join('?' * len(score_fields))
+            ),
+            ([s[field] for field in score_fields] for s in scores)
+        )
+
+    def add(self, score):
+        with self.db:
+            self.insert([score])
+
+    def import_csv(self, path):
+        # Copies a scores.csv file into the database, once per file; returns
+        # how many scores were imported.
+        path = os.path.abspath(path)
+
+        with self.db:
+            imported = self.db.execute(
+                "SELECT 1 FROM imported_files WHERE path = ?", (path,)
+            ).fetchone()
+
+            if imported is not None or not os.path.exists(path):
+                return 0
+
+            # Best first, so ties keep the order the CSV had them in.
+            scores = read_csv(path)
+            self.insert(scores)
+
+            self.db.execute("INSERT INTO imported_files VALUES (?)", (path,))
+
+        return len(scores)
+
+    def close(self):
+        self.db.close()
+
+
+class ScoreWriter:
+    # Saves scores on a background thread so the game loop never waits on
+    # the disk. The thread opens its own store with open_store(), since
+    # SQLite connections stay on the thread that made them. close() waits
+    # for every queued save to finish.
+
+    def __init__(self, open_store):
+        self.queue = queue.Queue()
+
+        # Seconds spent in store.add(), and from save() until it finished.
+        self.write_times = []
+        self.latencies = []
+        self.errors = 0
+
+        self.thread = threading.Thread(
+            target=self.run, args=(open_store,), name="score-writer", daemon=True
+        )
+        self.thread.start()
+
+    def save(self, score):
+        self.queue.put((time.perf_counter(), score))
+
+    def run(self, open_store):
+        store = open_store()
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            queued, score = item
+
+            start = time.perf_counter()
+            try:
+                store.add(score)
+            except Exception as e:
+                print("Could not save score: {}".format(e))
+                self.errors += 1
+            done = time.perf_counter()
+
+            self.write_times.append(done - start)
+            self.latencies.append(done - queued)
+
+        store.close()
+
+    def close(self):
+        if self.thread is None:
+            return
+
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def stats(self):
+        def summary(times):
+            if len(times) == 0:
+                return None
+            return {
+                'mean_ms': 1000 * sum(times) / len(times),
+                'max_ms': 1000 * max(times),
+            }
+
+        return {
+            'writes': len(self.write_times),
+            'errors': self.errors,
+            'pending': self.queue.qsize(),
+            'write': summary(self.write_times),
+            'latency': summary(self.latencies),
+        }
+
+
+def open_store(backend, csv_path, db_path):
+    if backend == 'csv':
+        return CSVScoreStore(csv_path)
+
+    if backend == 'sqlite':
+        store = SQLiteScoreStore(db_path)
+
+        n = store.import_csv(csv_path)
+        if n > 0:
+            print("Imported {} scores from {}.".format(n, csv_path))
+
+        return store
+
+    raise ValueError("unknown score backend: {}".format(backend))
@@ -2,59 +2,34 @@ import pygame
 import numpy as np
 import math
 import sys
-import csv
 import time
 import game_data
 import effects
+import text_cache
+import score_store
 
 score_cutoff = 10
-score_fields = [
-    'name',
-    'timestamp',
-    'score',
-    'time',
-    'waves',
-    'difficulty'
-]
-
-def read_scores(f='./scores.csv'):
-    global score_cutoff
-    try:
-        with open(f, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            return sorted(
-                [{
-                    'name': row['name'],
-                    'timestamp': row['timestamp'],
-                    'score': int(row['score']),
-                    'time': float(row['time']),
-                    'waves': int(row['waves']),
-                    'difficulty': int(row.get('difficulty', 1))
-                } for row in reader],
-                key=lambda v: v['score'],
-                reverse=True
-            )
-    except FileNotFoundError as e:
-        print("Could not find scores file!")
-        return []
-
-saved_scores = read_scores()
-print("Read {} scores.".format(len(saved_scores)))
-
-def sort_scores():
-    global saved_scores, score_cutoff
-    saved_scores = sorted(
-        saved_scores,
-        key=lambda v: v['score'],
-        reverse=True
+
+def open_store():
+    return score_store.open_store(
+        game_data.score_backend, game_data.score_csv_path, game_data.score_db_path
     )
 
-def write_scores(score_list, f='./scores.csv'):
-    with open(f, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, score_fields)
+store = open_store()
+print("Read {} scores.".format(store.count()))
+
+# The best score_cutoff scores. saved_scores is its list, best first, and
+# all the game ever shows.
+leaderboard = score_store.Leaderboard(score_cutoff, store.top(score_cutoff))
+saved_scores = leaderboard.scores
+
+store.close()
+
+# Saves go through this from here on; call writer.close() before exiting.
+writer = score_store.ScoreWriter(open_store)
 
-        writer.writeheader()
-        writer.writerows(score_list)
+# Rendered high score panel; cleared whenever saved_scores changes.
+high_score_panel = None
 
 def current_score_object(name):
     return {
@@ -67,23 +42,23 @@ def current_score_object(name):
     }
 
 def save_score(name='Unknown'):
-    global saved_score
+    global high_score_panel
 
-    saved_scores.append(current_score_object(name))
-    sort_scores()
-    write_scores(saved_scores)
+    score = current_score_object(name)
+    writer.save(score)
 
-def is_high_score():
-    global saved_scores
-    if len(saved_scores) < score_cutoff:
-        return True
-
-    threshold = min([s['score'] for s in saved_scores[:score_cutoff]])
+    if leaderboard.insert(score):
+        high_score_panel = None
 
-    return game_data.score > threshold
+def is_high_score():
+    # Runs every frame during a game.
+    return game_data.score > leaderboard.threshold
 
 def render_high_scores():
-    global saved_scores
+    global saved_scores, high_score_panel
+
+    if high_score_panel is not None:
+        return high_score_panel
 
     surface = pygame.Surface(
         (game_data.hs_screen_width, game_data.screen_dims[1])
@@ -156,6 +131,7 @@ def render_high_scores():
 
             current_h += line_spacing
 
+    high_score_panel = surface
     return surface
 
 
@@ -165,6 +141,10 @@ class NameInputScreen:
 
     def __init__(self):
         self.screen = pygame.surface.Surface(game_data.screen_dims, flags=pygame.SRCALPHA)
+        self.screen.fill((0, 0, 0, 0))
+
+        # Parts of self.screen drawn on by the last update().
+        self.drawn_rects = []
 
     def reset(self):
         pygame.key.set_repeat(500, 100)
@@ -182,7 +162,10 @@ class NameInputScreen:
     def update(self, dt):
         self.t += dt
 
-        self.screen.fill((0, 0, 0, 0))
+        for rect in self.drawn_rects:
+            self.screen.fill((0, 0, 0, 0), rect)
+
+        self.drawn_rects = []
 
         hs_display = effects.render_striped_text(
             "High Score", game_data.prompt_font,
@@ -191,30 +174,31 @@ class NameInputScreen:
 
         w, h = hs_display.get_size()
 
-        self.screen.blit(
+        self.drawn_rects.append(self.screen.blit(
             hs_display,
             (400 - (w/2), 200 - (h/2))
-        )
+        ))
 
-        prompt_display = game_data.prompt_font.render(
-            "Enter Name", True, (255, 255, 255)
+        prompt_display = text_cache.labels.render(
+            game_data.prompt_font, "Enter Name", True, (255, 255, 255)
         )
 
         w, h = prompt_display.get_size()
-        self.screen.blit(
+        self.drawn_rects.append(self.screen.blit(
             prompt_display,
             (400 - (w/2), 300 - (h/2))
-        )
+        ))
 
-        prompt2_display = game_data.display_font.render(
-            "Press Enter When Ready", True, (255, 255, 255)
+        prompt2_display = text_cache.labels.render(
+            game_data.display_font, "Press Enter When Ready", True,
+            (255, 255, 255)
         )
 
         w2, h2 = prompt2_display.get_size()
-        self.screen.blit(
+        self.drawn_rects.append(self.screen.blit(
             prompt2_display,
             (400 - (w2 / 2), 300 + (h2/2))
-        )
+        ))
 
 
         rendered_text = self.current_name
@@ -224,16 +208,16 @@ class NameInputScreen:
         else:
             offset = game_data.input_font.size('|')[0]
 
-        name_display = game_data.input_font.render(
-            rendered_text, True, (255, 255, 255)
+        name_display = text_cache.labels.render(
+            game_data.input_font, rendered_text, True, (255, 255, 255)
         )
 
         w, h = name_display.get_size()
 
-        self.screen.blit(
+        self.drawn_rects.append(self.screen.blit(
             name_display,
             (400 - ((w + offset) / 2), 500 - (h/2))
-        )
+        ))
 
 
 
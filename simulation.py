@@ -0,0 +1,130 @@
+import entities
+import waves
+import game_data
+import scheduler
+import frame_timing
+
+# Game logic shared by the windowed game loop in curtainfire.py and the
+# headless runner in headless.py. Nothing here renders or reads the display.
+
+# waves.update() runs every wave_period seconds of game time. Wave logic was
+# tuned against a 25 ms timer that passed it the frame time of the 60 FPS
+# cap, so it keeps getting that as its dt.
+wave_period = 0.025
+wave_dt = 1 / 60
+wave_clock = 0
+
+step_scheduler = scheduler.FixedStepScheduler(
+    game_data.tick_rate, game_data.max_substeps
+)
+
+def new_game():
+    global wave_clock
+
+    entities.clear_bullets()
+    entities.player.reset()
+    waves.reset()
+    game_data.reset()
+
+    wave_clock = 0
+    step_scheduler.reset()
+
+def advance_clock(dt):
+    if game_data.game_running:
+        game_data.t += dt
+
+        # Decrement respawn timer if necessary:
+        if game_data.get_game_state() == 'respawn':
+            game_data.respawn_timer -= dt
+
+def waves_active():
+    return game_data.get_game_state() in ('gameplay', 'respawn')
+
+def advance_wave_clock(dt):
+    # Returns how many wave updates are due after dt more game time.
+    global wave_clock
+
+    wave_clock += dt
+
+    n = 0
+    while wave_clock >= wave_period:
+        wave_clock -= wave_period
+        n += 1
+
+    return n
+
+def update_waves(dt):
+    # When a tick covers more than one wave period, every update but the
+    # last was due earlier in the tick than the bullets integrating from
+    # here assume. Their bullets get that head start, so streams stay
+    # evenly spaced at low tick rates instead of spawning in pairs.
+    n = advance_wave_clock(dt)
+
+    for i in range(n):
+        if not waves_active():
+            continue
+
+        head_start = (n - 1 - i) * wave_period
+        if head_start > 0:
+            entities.spawn_ahead(lambda: waves.update(wave_dt), head_start)
+        else:
+            waves.update(wave_dt)
+
+def update_entities(dt):
+    if game_data.get_game_state() == 'respawn' and entities.player.dead and game_data.respawn_timer < 3:
+        entities.player.reset()
+
+    # Normal game flow-- update bullets and check for invalid positions.
+    entities.player.update(dt)
+    entities.update_bullets(dt)
+
+    # After the bullets, so beams that follow one see where it is now.
+    entities.all_beams.update(dt)
+    frame_timing.timer.mark('entities')
+
+def cull():
+    # Remove bullets that went out of bounds and score one point for each.
+    n_culled = entities.all_bullets.cull(game_data.screen_dims)
+
+    if n_culled > 0 and game_data.get_game_state() == 'gameplay':
+        game_data.change_score(n_culled)
+
+    frame_timing.timer.mark('cull')
+
+def update(dt):
+    update_entities(dt)
+    cull()
+
+def check_collision():
+    # Returns where the player was hit, or None.
+    if game_data.get_game_state() != 'gameplay':
+        return None
+
+    if entities.player_collision() is None:
+        return None
+
+    print("Time: {:.3f}\nScore: {}".format(game_data.t - 3, game_data.score))
+
+    hit_pos = entities.player.pos.copy()
+    entities.player.kill()
+
+    game_data.lives -= 1
+    game_data.respawn_timer = game_data.respawn_length
+
+    if game_data.lives < 0:
+        game_data.game_over()
+
+    return hit_pos
+
+def tick(dt):
+    # One fixed simulation step; returns where the player was hit, or None.
+    advance_clock(dt)
+    update_waves(dt)
+    frame_timing.timer.mark('waves')
+
+    update(dt)
+
+    hit_pos = check_collision()
+    frame_timing.timer.mark('collision')
+
+    return hit_pos
@@ -0,0 +1,102 @@
+import math
+import numpy as np
+
+# Cell coordinates are packed into one int64 key as cx * _stride + cy, so
+# all cells of one grid column are contiguous in key order.
+_offset = 1 << 20
+_stride = 1 << 21
+_dead_key = np.iinfo(np.int64).max
+
+class SpatialHash:
+    # Uniform grid over point positions, stored as the point indices sorted
+    # by cell key. Each rebuild starts from the previous frame's ordering;
+    # points rarely change cell between frames, so the stable sort runs over
+    # nearly sorted data.
+
+    def __init__(self, cell_size=32):
+        self.cell_size = cell_size
+
+        self.pos = np.zeros((0, 2), dtype=np.float64)
+        self.alive = np.zeros(0, dtype=bool)
+
+        self.order = np.zeros(0, dtype=np.intp)
+        self.sorted_keys = np.zeros(0, dtype=np.int64)
+        self.n_live = 0
+
+    def cell_keys(self, pos):
+        cells = np.floor(pos / self.cell_size).astype(np.int64)
+        cells += _offset
+
+        return cells[:, 0] * _stride + cells[:, 1]
+
+    def rebuild(self, pos, alive):
+        n = len(pos)
+
+        keys = self.cell_keys(pos)
+        keys[~alive] = _dead_key
+
+        order = self.order
+        if len(order) != n:
+            order = order[order < n]
+            if len(self.pos) < n:
+                order = np.concatenate(
+                    (order, np.arange(len(self.pos), n, dtype=np.intp))
+                )
+
+        keys = keys[order]
+        perm = np.argsort(keys, kind='stable')
+
+        self.order = order[perm]
+        self.sorted_keys = keys[perm]
+        self.n_live = int(np.count_nonzero(alive))
+
+        self.pos = pos
+        self.alive = alive
+
+    def query_cells(self, x0, y0, x1, y1):
+        # Indices of all points in cells overlapping the given box. Queries
+        # usually cover a cell or two, so the cell range is worked out on
+        # Python scalars; small numpy arrays cost more than they save here.
+        cx0 = math.floor(x0 / self.cell_size) + _offset
+        cy0 = math.floor(y0 / self.cell_size) + _offset
+        cx1 = math.floor(x1 / self.cell_size) + _offset
+        cy1 = math.floor(y1 / self.cell_size) + _offset
+
+        keys = self.sorted_keys[:self.n_live]
+
+        found = []
+        for cx in range(cx0, cx1 + 1):
+            lo = keys.searchsorted(cx * _stride + cy0, side='left')
+            hi = keys.searchsorted(cx * _stride + cy1, side='right')
+
+            if hi > lo:
+                found.append(self.order[lo:hi])
+
+        if len(found) == 0:
+            return np.zeros(0, dtype=np.intp)
+
+        if len(found) == 1:
+            found = found[0]
+        else:
+            found = np.concatenate(found)
+
+        # Points may have died since the last rebuild.
+        return found[self.alive[found]]
+
+    def query_rect(self, rect, margin=0):
+        return self.query_cells(
+            rect.left - margin, rect.top - margin,
+            rect.right + margin, rect.bottom + margin
+        )
+
+    def query_radius(self, point, radius):
+        # Indices of all points within radius of point.
+        candidates = self.query_cells(
+            point[0] - radius, point[1] - radius,
+            point[0] + radius, point[1] + radius
+        )
+
+        disp = self.pos[candidates] - point
+        dist_sq = np.sum(disp ** 2, axis=1)
+
+        return candidates[dist_sq <= radius ** 2]
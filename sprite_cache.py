@@ -0,0 +1,134 @@
+import pygame
+import math
+from collections import OrderedDict
+import game_data
+
+class RotationCache:
+    # Pre-rotated copies of sprite base images and their collision masks,
+    # keyed by (base image, heading bucket). Least recently used entries are
+    # evicted once max_size is reached.
+
+    def __init__(self, steps, max_size):
+        self.steps = steps
+        self.max_size = max_size
+
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bucket(self, angle):
+        return int(round(angle * self.steps / (2 * math.pi))) % self.steps
+
+    def get(self, base_image, bucket):
+        key = (base_image, bucket)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+
+        angle = bucket * 360 / self.steps
+        image = pygame.transform.rotate(base_image, -angle)
+        entry = (image, pygame.mask.from_surface(image))
+
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+        return entry
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0
+        return self.hits / total
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate(),
+        }
+
+    def clear(self):
+        self.entries.clear()
+
+
+def _draw_ring(surface, color):
+    pygame.draw.circle(surface, color, (10, 10), 10, 3)
+    pygame.draw.circle(surface, color, (10, 10), 3)
+
+def _polygon_drawer(points):
+    def draw(surface, color):
+        pygame.draw.polygon(surface, color, points)
+    return draw
+
+# shape name -> (surface size, draw function)
+base_shapes = {
+    'triangle': ((20, 10), _polygon_drawer([(0, 0), (0, 10), (20, 5)])),
+    'arrowhead': ((20, 10), _polygon_drawer([(0, 0), (5, 5), (0, 10), (20, 5)])),
+    'diamond': ((20, 10), _polygon_drawer([(0, 5), (10, 0), (20, 5), (10, 10)])),
+    'ring': ((20, 20), _draw_ring),
+}
+
+class BaseImageCache:
+    # Unrotated sprite images, rasterized once per (shape, color) and shared
+    # by every bullet that uses them.
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, shape, color):
+        key = (shape, tuple(color))
+
+        image = self.entries.get(key)
+        if image is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return image
+
+        self.misses += 1
+
+        size, draw = base_shapes[shape]
+        image = pygame.Surface(size, flags=pygame.SRCALPHA)
+        image.fill((0, 0, 0, 0))
+        draw(image, color)
+
+        # Match the display's pixel format so blits don't convert per frame;
+        # there is no display to match when running headless.
+        if pygame.display.get_surface() is not None:
+            image = image.convert_alpha()
+
+        self.entries[key] = image
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        return image
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+rotation_cache = RotationCache(
+    game_data.rotation_steps, game_data.rotation_cache_size
+)
+base_images = BaseImageCache(game_data.base_image_cache_size)
@@ -0,0 +1,154 @@
+import pygame
+from collections import OrderedDict
+import game_data
+
+class TextCache:
+    # Rendered text surfaces keyed by (font, text, antialias, color), for
+    # labels that are drawn every frame but rarely change. Least recently
+    # used entries are evicted once max_size is reached.
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, font, text, antialias, color):
+        key = (font, text, antialias, tuple(color))
+
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+
+        self.misses += 1
+
+        surface = font.render(text, antialias, color)
+
+        self.entries[key] = surface
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+        return surface
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0
+        return self.hits / total
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate(),
+        }
+
+    def clear(self):
+        self.entries.clear()
+
+
+class GlyphAtlas:
+    # Per-character surfaces of one font, antialias setting and color, for
+    # text that changes every frame (timers, scores, FPS). Strings are drawn
+    # by blitting cached glyphs at their advances instead of rasterizing the
+    # whole string again. A constant prefix ("Time: ") can be passed
+    # separately; it is rendered once as a whole and drawn as one blit.
+
+    preload = "0123456789.:- "
+
+    def __init__(self, font, antialias, color):
+        self.font = font
+        self.antialias = antialias
+        self.color = color
+
+        self.height = font.get_height()
+
+        # char -> (surface, advance); prefix -> surface
+        self.glyphs = {}
+        self.prefixes = {}
+
+        for c in self.preload:
+            self.glyph(c)
+
+    def glyph(self, c):
+        entry = self.glyphs.get(c)
+
+        if entry is None:
+            surface = self.font.render(c, self.antialias, self.color)
+
+            # Glyphs are blitted every frame, so match the display format.
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()
+
+            entry = (surface, self.font.size(c)[0])
+            self.glyphs[c] = entry
+
+        return entry
+
+    def prefix(self, text):
+        surface = self.prefixes.get(text)
+
+        if surface is None:
+            surface = self.font.render(text, self.antialias, self.color)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()
+
+            self.prefixes[text] = surface
+
+        return surface
+
+    def size(self, text, prefix=''):
+        w = 0
+        if prefix:
+            w = self.prefix(prefix).get_width()
+
+        for c in text:
+            w += self.glyph(c)[1]
+
+        return (w, self.height)
+
+    def draw(self, surface, text, pos, prefix=''):
+        # Returns the rect that was drawn to.
+        x, y = pos
+
+        blits = []
+        if prefix:
+            prefix_surface = self.prefix(prefix)
+            blits.append((prefix_surface, (x, y)))
+            x += prefix_surface.get_width()
+
+        for c in text:
+            glyph, advance = self.glyph(c)
+            blits.append((glyph, (x, y)))
+            x += advance
+
+        rects = surface.blits(blits)
+        if len(rects) == 0:
+            return pygame.Rect(pos, (0, 0))
+
+        return rects[0].unionall(rects[1:])
+
+
+labels = TextCache(game_data.text_cache_size)
+
+# (font, antialias, color) -> GlyphAtlas
+atlases = {}
+
+def atlas(font, color, antialias=True):
+    key = (font, antialias, tuple(color))
+
+    a = atlases.get(key)
+    if a is None:
+        a = GlyphAtlas(font, antialias, color)
+        atlases[key] = a
+
+    return a
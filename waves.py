@@ -135,7 +135,7 @@ class TargetedSpreadWave(Wave):
             if np.sqrt(np.sum((entities.player.pos - pt) ** 2)) > self.speed:
                 valid_starts.append(pt)
 
-        self.start = np.array(random.choice(valid_starts), dtype=np.int)
+        self.start = np.array(random.choice(valid_starts), dtype=int)
 
     def update(self, dt):
         Wave.update(self, dt)
@@ -189,7 +189,7 @@ class ClusterWave(Wave):
             self.targets.append(np.array((
                 random.uniform(50, 750),
                 random.uniform(50, 750)
-            ), dtype=np.int))
+            ), dtype=int))
 
     def update(self, dt):
         Wave.update(self, dt)
@@ -200,7 +200,7 @@ class ClusterWave(Wave):
 
             for target in self.targets:
                 start = np.array(
-                    (random.uniform(20, 780), 795), dtype=np.int
+                    (random.uniform(20, 780), 795), dtype=int
                 )
 
                 disp_vec = start - target
@@ -857,9 +857,9 @@ def update(dt):
 
         if wave_completion_time is None:
             print("Wave completed!")
-            wave_completion_time = pygame.time.get_ticks()
+            wave_completion_time = game_data.get_ticks()
 
-        break_time = pygame.time.get_ticks() - wave_completion_time
+        break_time = game_data.get_ticks() - wave_completion_time
         if break_time >= 500:  # .5 seconds
             next_wave()
     else: